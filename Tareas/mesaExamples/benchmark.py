@@ -0,0 +1,291 @@
+"""Speed and memory benchmarks of the four example models.
+
+Measures, for every model and grid size (and number of robots for
+randomAgents2), the time to build the model, the steps per second, the
+peak RSS of the process and the peak memory allocated by Python. Every
+case runs in its own process, because the two cellular automata and the
+two Roomba examples use the same package names, and so the peak RSS of a
+case doesn't include the previous ones. Every case is run --repeats
+times (3 by default) and keeps the median of each metric, so one run
+slowed down or sped up by the rest of the machine doesn't move the
+result. A model that stops running (the rows modes
+after height - 1 steps) is built again outside the timed part, so a
+case always steps for --min-time seconds.
+
+Run it from this folder:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --sizes 50 200 1000 2000 --agents 10 100 1000
+    python benchmark.py --baseline baseline.json --tolerance 0.25
+
+With --baseline every result is compared with the saved one, and the
+script exits with status 1 and prints REGRESSION lines if a case is
+slower or uses more memory than the tolerance allows. A difference
+also has to be bigger than the FLOORS of the metric, so the noise of a
+case that takes a few milliseconds isn't reported.
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Case name -> (folder, module, class, fixed parameters, takes num_agents)
+MODELS = {
+    "ca-rows-agents": ("cellularAutomata", "game_of_life.model", "ConwaysGameOfLife",
+                       {"mode": "rows", "engine": "agents"}, False),
+    "ca-rows-packed": ("cellularAutomata", "game_of_life.model", "ConwaysGameOfLife",
+                       {"mode": "rows", "engine": "packed"}, False),
+    "ca-life-numpy": ("cellularAutomata", "game_of_life.model", "ConwaysGameOfLife",
+                      {"mode": "life", "engine": "numpy"}, False),
+    "ca-life-parallel": ("cellularAutomata", "game_of_life.model", "ConwaysGameOfLife",
+                         {"mode": "life", "engine": "parallel"}, False),
+    "ca2-agents": ("cellularAutomata2", "game_of_life.model2", "ConwaysGameOfLife",
+                   {"engine": "agents"}, False),
+    "ca2-numpy": ("cellularAutomata2", "game_of_life.model2", "ConwaysGameOfLife",
+                  {"engine": "numpy"}, False),
+    "ca2-parallel": ("cellularAutomata2", "game_of_life.model2", "ConwaysGameOfLife",
+                     {"engine": "parallel"}, False),
+    "roomba": ("randomAgents", "random_agents.model", "RandomModel", {}, False),
+    "roomba2-agents": ("randomAgents2", "random_agents.model", "RandomModel",
+                       {"engine": "agents"}, True),
+    "roomba2-numpy": ("randomAgents2", "random_agents.model", "RandomModel",
+                      {"engine": "numpy"}, True),
+    "roomba2-headless": ("randomAgents2", "random_agents.model", "RandomModel",
+                         {"engine": "numpy", "headless": True}, True),
+}
+
+# Metrics where a bigger value is a regression
+COST_METRICS = ("build_s", "peak_rss_mb", "alloc_peak_mb")
+
+# Smallest difference with the baseline that counts as a regression, for
+# the cost metrics and the time of a step (1 / steps_per_s)
+FLOORS = {"build_s": 0.05, "step_s": 1e-5, "peak_rss_mb": 5.0, "alloc_peak_mb": 1.0}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB, None where it can't be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def close(model):
+    """Close the model if it has something to close, like the workers of the parallel engines."""
+    if hasattr(model, "close"):
+        model.close()
+
+
+def run_case(case):
+    """Run one case in this process and return its result dict."""
+    warnings.filterwarnings("ignore")
+    from mesa import Agent
+
+    folder, module, class_name, params, _ = MODELS[case["model"]]
+    sys.path.insert(0, os.path.join(HERE, folder))
+    model_class = getattr(importlib.import_module(module), class_name)
+
+    params = dict(params, width=case["size"], height=case["size"], seed=1)
+    if case["agents"] is not None:
+        params["num_agents"] = case["agents"]
+
+    start = time.perf_counter()
+    model = model_class(**params)
+    build = time.perf_counter() - start
+
+    # Step until min_time has passed or the step limit. A model that stops
+    # is built again, without counting the time of the build
+    steps = 0
+    elapsed = 0.0
+    while steps < case["max_steps"] and elapsed < case["min_time"]:
+        if not model.running:
+            # Mesa counts the agent ids of every model in Agent._ids, which
+            # would keep the stopped models and their agents in memory
+            getattr(Agent, "_ids", {}).pop(model, None)
+            close(model)
+            del model
+            model = model_class(**params)
+            if not model.running:
+                break
+        start = time.perf_counter()
+        while model.running and steps < case["max_steps"]:
+            model.step()
+            steps += 1
+            if elapsed + time.perf_counter() - start >= case["min_time"]:
+                break
+        elapsed += time.perf_counter() - start
+    rss = peak_rss_mb()
+
+    # tracemalloc slows everything down, so the allocations are measured
+    # in a second, shorter run after the timings
+    alloc_peak = None
+    if case["alloc_steps"]:
+        close(model)
+        del model
+        tracemalloc.start()
+        model = model_class(**params)
+        for _ in range(case["alloc_steps"]):
+            if not model.running:
+                break
+            model.step()
+        alloc_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    close(model)
+    # The parallel engines have to stop their workers in close()
+    if multiprocessing.active_children():
+        raise RuntimeError(f"{case['model']} left worker processes running after close()")
+
+    return {
+        "model": case["model"],
+        "size": case["size"],
+        "agents": case["agents"],
+        "build_s": build,
+        "steps": steps,
+        "steps_per_s": steps / elapsed if elapsed else None,
+        "peak_rss_mb": rss,
+        "alloc_peak_mb": alloc_peak,
+    }
+
+
+def median(results):
+    """Combine the repeats of a case into the median of every metric."""
+    combined = results[0].copy()
+    for metric in ("steps", "steps_per_s") + COST_METRICS:
+        values = [result[metric] for result in results if result[metric] is not None]
+        combined[metric] = statistics.median(values) if values else None
+    return combined
+
+
+def run_benchmarks(models, sizes, agents, min_time=1.0, max_steps=10_000, alloc_steps=5, repeats=3):
+    """Run every combination of models, sizes and (for randomAgents2) agent counts.
+
+    Every case runs `repeats` times, each in a new process, and keeps the
+    median of every metric (see median()). The allocations are only measured
+    in the first one.
+
+    Returns:
+        List of result dicts (see run_case), in the order they were run.
+    """
+    cases = []
+    for name in models:
+        counts = agents if MODELS[name][4] else [None]
+        for size in sizes:
+            for count in counts:
+                cases.append({"model": name, "size": size, "agents": count, "min_time": min_time,
+                              "max_steps": max_steps, "alloc_steps": alloc_steps})
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        runs = []
+        for repeat in range(repeats):
+            # A new process per run, see the module docstring. Only the
+            # first one measures the allocations
+            run = dict(case, alloc_steps=case["alloc_steps"] if repeat == 0 else 0)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(run_case, run).result())
+        result = median(runs)
+        print(format_result(result), flush=True)
+        results.append(result)
+    return results
+
+
+def format_result(result):
+    def number(value, digits):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    agents = "" if result["agents"] is None else f" x{result['agents']}"
+    return (f"{result['model']:>16} {result['size']:>5}^2{agents:<7} build {number(result['build_s'], 3):>8} s"
+            f"  {number(result['steps_per_s'], 1):>9} steps/s  rss {number(result['peak_rss_mb'], 1):>7} MiB"
+            f"  alloc {number(result['alloc_peak_mb'], 1):>7} MiB")
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for every result worse than its baseline by more than the tolerance.
+
+    The difference also has to be bigger than the FLOORS of the metric.
+    """
+    def key(result):
+        return result["model"], result["size"], result["agents"]
+
+    saved = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = saved.get(key(result))
+        if old is None:
+            continue
+        name = f"{result['model']} {result['size']}^2" + ("" if result["agents"] is None else f" x{result['agents']}")
+        if old["steps_per_s"] and result["steps_per_s"]:
+            if (result["steps_per_s"] < old["steps_per_s"] * (1 - tolerance)
+                    and 1 / result["steps_per_s"] - 1 / old["steps_per_s"] > FLOORS["step_s"]):
+                regressions.append(f"{name}: {result['steps_per_s']:.1f} steps/s, "
+                                   f"baseline {old['steps_per_s']:.1f}")
+        for metric in COST_METRICS:
+            if not old.get(metric) or result[metric] is None:
+                continue
+            if result[metric] > old[metric] * (1 + tolerance) and result[metric] - old[metric] > FLOORS[metric]:
+                regressions.append(f"{name}: {metric} {result[metric]:.3f}, baseline {old[metric]:.3f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the example models.")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS), help="cases to run")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500], help="grid sides")
+    parser.add_argument("--agents", type=int, nargs="+", default=[10, 100], help="robots of randomAgents2")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds of stepping per case")
+    parser.add_argument("--max-steps", type=int, default=10_000, help="step limit per case")
+    parser.add_argument("--alloc-steps", type=int, default=5,
+                        help="steps of the tracemalloc run (0 to skip the allocations)")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per case, the median of each metric is kept")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    parser.add_argument("--baseline", default=None, help="JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args(argv)
+    if args.repeats < 1:
+        parser.error("--repeats has to be at least 1")
+
+    results = run_benchmarks(args.models, args.sizes, args.agents, args.min_time, args.max_steps,
+                             args.alloc_steps, args.repeats)
+
+    if args.output:
+        import mesa
+        import numpy
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mesa": mesa.__version__,
+            "numpy": numpy.__version__,
+            "repeats": args.repeats,
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
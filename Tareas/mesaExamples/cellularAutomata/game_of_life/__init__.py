@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The helpers shared with the other examples live in mesaExamples/shared
+_EXAMPLES = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _EXAMPLES not in sys.path:
+    sys.path.append(_EXAMPLES)
@@ -45,25 +45,23 @@ class Cell(FixedAgent):
         for n in self.neighbors:
             live_neighbors += n.is_alive
 
-        # Get the neighbors and apply the rules on whether to be alive or dead
-        # at the next tick.
-        #live_neighbors = sum(neighbor.is_alive for neighbor in self.neighbors)
-
-        # Assume nextState is unchanged, unless changed below.
-        self._next_state = self.state
+        # Apply the B/S rule of the model: a dead cell is born with a count in
+        # model.birth, an alive cell survives with a count in model.survive
+        if self.is_alive:
+            alive = live_neighbors in self.model.survive
+        else:
+            alive = live_neighbors in self.model.birth
+        self._next_state = self.ALIVE if alive else self.DEAD
 
     # Calculate next state only from the 3 neighbors in the upper row
     def set_next_state(self, left_state, center_state, right_state):
-        # Ensure values are 0 or 1 for simplicity
-        a = 1 if left_state == self.ALIVE else 0
-        b = 1 if center_state == self.ALIVE else 0
-        c = 1 if right_state == self.ALIVE else 0
-        pattern = f"{a}{b}{c}"
-
-        if pattern in ["110", "100", "011", "001"]: # Alive patterns
-            self._next_state = self.ALIVE
-        else:
-            self._next_state = self.DEAD
+        """Look up the next state in the rule table compiled by the model.
+
+        The (left, center, right) pattern read as a binary number is the index
+        of the table, e.g. 110 -> 6.
+        """
+        pattern = (left_state << 2) | (center_state << 1) | right_state
+        self._next_state = self.model.rule_table[pattern]
 
         self.state = self._next_state
         self._next_state = None
@@ -73,4 +71,44 @@ class Cell(FixedAgent):
         """Set the state to the new computed state -- computed in step()."""
         if self._next_state is not None:
             self.state = self._next_state
-            self._next_state = None
\ No newline at end of file
+            self._next_state = None
+
+
+class CellView(Cell):
+    """Cell whose state is read from the model's state array.
+
+    Used by the engines that keep the states in an array (numpy, parallel
+    and the packed engines with a grid): the model owns the states and the
+    agents only exist for the code that reads model.cell_grid (see CellViews).
+    """
+
+    @property
+    def state(self):
+        x, y = self.pos
+        return int(self.model.states[y, x])
+
+    @state.setter
+    def state(self, value):
+        x, y = self.pos
+        self.model.states[y, x] = value
+
+
+class CellViews(dict):
+    """The cell_grid of the array engines.
+
+    The CellView of a position is made the first time it is looked up, so
+    a large board doesn't build an agent per cell that nobody reads (the
+    pages draw from model.board()).
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def __missing__(self, position):
+        model = self.model
+        x, y = position
+        if not (0 <= x < model.width and 0 <= y < model.height):
+            raise KeyError(position)
+        view = self[position] = CellView(model, model.grid[position], init_state=int(model.states[y, x]))
+        return view
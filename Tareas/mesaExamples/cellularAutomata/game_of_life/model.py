@@ -1,15 +1,164 @@
+import numpy as np
 from mesa import Model
 from mesa.discrete_space import OrthogonalMooreGrid
-from .agent import Cell
+from .agent import Cell, CellViews
+from shared.boards import random_board
+from shared.hashlife import HashLife, next_row_bits
+from shared.parallel import TiledStepper
+from shared import checkpoint
+from shared.profiler import Profiler
+
+
+def compile_rule(rule):
+    """Return the lookup table of a Wolfram rule number (0 to 255).
+
+    Entry i of the table is the next state of a cell whose (left, center,
+    right) pattern is i in binary, which is bit i of the rule number.
+    Rule 90 gives 001, 011, 100 and 110 as the alive patterns.
+    """
+    rule = int(rule)
+    if not 0 <= rule <= 255:
+        raise ValueError(f"Rule must be between 0 and 255, got {rule}")
+    return tuple((rule >> pattern) & 1 for pattern in range(8))
+
+
+def row_to_array(bits, width, packed=False):
+    """Convert a packed row into a numpy array.
+
+    With packed=True the result has one byte per 8 cells, in the layout of
+    np.packbits(..., bitorder="little"). Otherwise one uint8 per cell.
+    """
+    row_bytes = np.frombuffer(bits.to_bytes((width + 7) // 8, "little"), dtype=np.uint8)
+    if packed:
+        return row_bytes
+    return np.unpackbits(row_bytes, count=width, bitorder="little")
+
+
+def parse_life_rule(rulestring):
+    """Parse a B/S rulestring such as "B3/S23" (Conway's Life) or "B36/S23".
+
+    Returns the (birth, survive) sets of neighbor counts: a dead cell with a
+    count in birth becomes alive, an alive cell with a count in survive
+    stays alive, every other cell dies.
+    """
+    birth = survive = None
+    for part in rulestring.upper().replace(" ", "").split("/"):
+        counts = part[1:]
+        if any(c not in "012345678" for c in counts):
+            raise ValueError(f"Invalid rulestring {rulestring!r}")
+        if part.startswith("B"):
+            birth = frozenset(int(c) for c in counts)
+        elif part.startswith("S"):
+            survive = frozenset(int(c) for c in counts)
+        else:
+            raise ValueError(f"Invalid rulestring {rulestring!r}")
+    if birth is None or survive is None:
+        raise ValueError(f"Rulestring {rulestring!r} needs a B and an S part")
+    return birth, survive
+
+
+# Engines available for every mode
+ENGINES = {
+    "rows": ("agents", "packed", "hashlife"),
+    "life": ("agents", "numpy", "parallel"),
+}
 
 
 class ConwaysGameOfLife(Model):
-    """Represents the 2-dimensional array of cells in Conway's Game of Life."""
+    """Represents the 2-dimensional array of cells in Conway's Game of Life.
 
-    def __init__(self, width=50, height=50, initial_fraction_alive=0.2, seed=None):
+    Args:
+        mode: "rows" fills the grid one row per step with an elementary
+            automaton (the Wolfram `rule`), "life" updates the whole grid
+            every step with the B/S rule in `life_rule`.
+        engine: "agents" computes every cell through the Cell agents. For the
+            rows mode "packed" keeps only the last row packed in an int and
+            computes the next one with bitwise operations, "hashlife" is the
+            packed engine plus advance() jumps of many generations at once
+            with a memoized tree of the row (see shared/hashlife.py); rows
+            that don't repeat are stepped like the packed engine. For the life mode
+            "numpy" keeps the board in an array and counts the neighbors of
+            every cell at once, and "parallel" splits that array among
+            `workers` processes that share it (see shared/parallel.py).
+        headless: Not for the agents engine. Don't build the grid nor any
+            Cell agent, so very large automata can be computed. A headless
+            rows model never stops, since it has no last row to reach.
+        incremental: Only for the agents engine. Evaluate only the cells whose
+            neighborhood changed in the last step; the rest keep their state.
+        profile: Time the phases of every step in self.profiler (see
+            shared/profiler.py), like the compute and assume_state passes.
+        workers: Processes of the parallel engine, one per core by default.
+            They run until close() (the model is also a context manager).
+    """
+
+    def __init__(self, width=50, height=50, initial_fraction_alive=0.2, seed=None, rule=90,
+                 engine="agents", headless=False, mode="rows", life_rule="B3/S23", incremental=False,
+                 profile=False, workers=None):
         """Create a new playing area of (width, height) cells."""
         super().__init__(seed=seed) # seed es para la aleatoridad pero se dice desde donde de la secuencial se empieza
 
+        if mode not in ENGINES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {tuple(ENGINES)}")
+        if engine not in ENGINES[mode]:
+            raise ValueError(f"Engine {engine!r} is not available for the {mode} mode, expected one of {ENGINES[mode]}")
+        if headless and engine == "agents":
+            raise ValueError("The agents engine needs the grid and can't run headless")
+        if incremental and engine != "agents":
+            raise ValueError("The incremental mode is only available for the agents engine")
+        self.mode = mode
+        self.engine = engine
+        self.incremental = incremental
+        self.width = width
+        self.height = height
+
+        # Time of the phases of every step, see shared/profiler.py
+        self.profiler = Profiler(enabled=profile)
+
+        # Cells that changed since the last take_changes(), see that method
+        self.changes = None
+
+        # Wolfram rule used to compute every new row, compiled once
+        self.rule = int(rule)
+        self.rule_table = compile_rule(rule)
+        self.hashlife = HashLife(self.rule_table) if engine == "hashlife" else None
+
+        # Life rule, as the sets used by the agents and as a table indexed by
+        # state * 9 + live neighbors for the numpy engine
+        self.life_rule = life_rule
+        self.birth, self.survive = parse_life_rule(life_rule)
+        self._life_array = np.array(
+            [n in self.birth for n in range(9)] + [n in self.survive for n in range(9)],
+            dtype=np.uint8,
+        )
+
+        # The row that has already been updated (height-1 = top row already initialized)
+        self.current_row = height - 1
+
+        # Number of rows computed after the initial one
+        self.generation = 0
+
+        # Maintain references to agents by position for direct access
+        self.cell_grid = {}
+
+        # States of the engines that keep them in an array, indexed as
+        # states[y, x]: the numpy and parallel engines and the packed ones
+        # with a grid. None for the agents engine and headless packed models
+        self.states = None
+
+        # Workers of the parallel engine, see _init_life()
+        self.tiles = None
+        self.workers = workers
+
+        if engine in ("packed", "hashlife"):
+            self._init_packed(initial_fraction_alive, headless)
+            self.running = True
+            return
+
+        if mode == "life":
+            self._init_life(initial_fraction_alive, headless)
+            self.running = True
+            return
+
         """Grid where cells are connected to their 8 neighbors.
 
         Example for two dimensions:
@@ -22,12 +171,6 @@ class ConwaysGameOfLife(Model):
         self.grid = OrthogonalMooreGrid((width, height), capacity=1, torus=True)
         # Torus means that the edges are connected so they always have 8 neighbors
 
-        # Maintain references to agents by position for direct access
-        self.cell_grid = {}
-
-        # The row that has already been updated (height-1 = top row already initialized)
-        self.current_row = height - 1
-
         # Initialize cells in the top row (height-1)
         for cell in self.grid.all_cells:
             x, y = cell.coordinate
@@ -42,15 +185,298 @@ class ConwaysGameOfLife(Model):
                 init_state=init_state,
             )
 
+        if incremental:
+            self._reset_dirty()
+
         self.running = True
 
+    def _init_packed(self, initial_fraction_alive, headless):
+        """Draw the top row into self.row_bits.
+
+        The random numbers are drawn in the same order as the agents engine,
+        so both engines start from the same row for the same seed.
+        """
+        self.row_bits = 0
+        for x in range(self.width):
+            if self.random.random() < initial_fraction_alive:
+                self.row_bits |= 1 << x
+        # step() takes the rows from this generator
+        self._rows = self.generations()
+
+        # Without the grid only the packed row exists
+        self.grid = None
+        if not headless:
+            self.grid = OrthogonalMooreGrid((self.width, self.height), capacity=1, torus=True)
+            # States of the rows drawn so far (the others are dead), for
+            # board() and the CellViews that cell_grid makes when looked up
+            self.states = np.zeros((self.height, self.width), dtype=np.uint8)
+            self.cell_grid = CellViews(self)
+            self.draw_row(self.current_row)
+
+    def _init_life(self, initial_fraction_alive, headless):
+        """Fill the whole board with random states for the life mode.
+
+        The random numbers are drawn in the order of grid.all_cells (column by
+        column) so both engines start from the same board for the same seed.
+        They go a few columns at a time straight into the uint8 board, see
+        shared/boards.py.
+        """
+        # Only the numpy engine keeps the array, the agents keep their own state.
+        # The parallel engine draws it into the memory shared with its workers
+        out = None
+        if self.engine == "parallel":
+            self.tiles = TiledStepper((self.height, self.width), "life", self._life_array, self.workers)
+            out = self.tiles.board
+        states = random_board(self.random, self.width, self.height, initial_fraction_alive, out)
+        if self.engine != "agents":
+            self.states = states
+
+        self.grid = None
+        if headless:
+            return
+        self.grid = OrthogonalMooreGrid((self.width, self.height), capacity=1, torus=True)
+        if self.engine != "agents":
+            # A CellView that reads self.states is only made when a cell of
+            # cell_grid is looked up
+            self.cell_grid = CellViews(self)
+            return
+        for cell in self.grid.all_cells:
+            x, y = cell.coordinate
+            self.cell_grid[(x, y)] = Cell(
+                self,
+                cell,
+                init_state=int(states[y, x]),
+            )
+
+        if self.incremental:
+            self._reset_dirty()
+
+    def _reset_dirty(self):
+        """Find the cells the incremental mode has to evaluate in the next step.
+
+        Only uses the current states, so it works for the first step and
+        for a board loaded from a checkpoint.
+        """
+        if self.mode == "life":
+            # Unless the rule gives birth with 0 neighbors, a cell with no
+            # alive cell around stays dead, so only the alive cells and their
+            # neighbors can change.
+            if 0 in self.birth:
+                self._dirty = set(self.agents)
+            else:
+                self._dirty = set()
+                for agent in self.agents:
+                    if agent.is_alive:
+                        self._dirty.add(agent)
+                        self._dirty.update(agent.neighbors)
+            return
+
+        # Columns alive in the current row, and columns to evaluate for
+        # the next one. A cell whose three cells above are dead gets the
+        # state of the cell above when the rule keeps 000 dead, so only
+        # the alive columns and their neighbors can differ.
+        width = self.width
+        self._alive = {x for x in range(width) if self.cell_grid[(x, self.current_row)].state}
+        if self.rule_table[0]:
+            self._dirty = set(range(width))
+        else:
+            self._dirty = {(x + dx) % width for x in self._alive for dx in (-1, 0, 1)}
+
+    def draw_row(self, y):
+        """Write the current packed row into row y of self.states.
+
+        No agent is made here: cell_grid makes the CellView of a cell the
+        first time it is looked up, so drawing a row only copies its bits.
+        """
+        row = row_to_array(self.row_bits, self.width)
+        self.states[y] = row
+        if self.changes is not None:
+            self.changes.update((x, y) for x in np.flatnonzero(row).tolist())
+
+    def board(self):
+        """Return the states of the grid as a (height, width) uint8 array.
+
+        Indexed as board[y, x]; cells without an agent (rows not drawn yet)
+        are dead. The numpy engines return their own array and the packed
+        engines the rows they drew, so only the agents engine has to read
+        every Cell agent. A headless model has no board, the result is empty.
+        """
+        if self.states is not None:
+            return self.states
+        if self.grid is None:
+            return np.zeros((0, 0), dtype=np.uint8)
+        board = np.zeros((self.height, self.width), dtype=np.uint8)
+        for (x, y), agent in self.cell_grid.items():
+            board[y, x] = agent.state
+        return board
+
+    def take_changes(self):
+        """Return the (x, y) of the cells that changed since the last call.
+
+        The first call returns None, meaning everything has to be drawn,
+        and turns the recording on; the steps only record while someone
+        takes the changes, so a model without a view doesn't pay for it.
+        """
+        changes = self.changes
+        self.changes = set()
+        return changes
+
+    def _record_row(self, y):
+        """Record the alive cells of the new row y, which started dead."""
+        if self.changes is not None:
+            self.changes.update((x, y) for x in range(self.width) if self.cell_grid[(x, y)].state)
+
+    def _record_flips(self, old):
+        """Record the cells of self.states that differ from the old copy."""
+        ys, xs = np.nonzero(self.states != old)
+        self.changes.update(zip(xs.tolist(), ys.tolist()))
+
+    def current_bits(self):
+        """Return the last computed row packed in an int (bit x = cell x)."""
+        if self.engine != "agents":
+            return self.row_bits
+        bits = 0
+        for x in range(self.width):
+            bits |= self.cell_grid[(x, self.current_row)].state << x
+        return bits
+
+    def generations(self):
+        """Yield the rows that follow the current one, forever.
+
+        Every row is packed in an int like self.row_bits. Only the previous
+        row is kept, so the number of generations is not limited by the
+        height of the grid nor by memory. The model itself is not advanced.
+        """
+        if self.mode != "rows":
+            raise ValueError("Only the rows mode produces rows")
+        bits = self.current_bits()
+        width = self.width
+        rule_table = self.rule_table
+        while True:
+            bits = next_row_bits(bits, width, rule_table)
+            yield bits
+
+    def save_spacetime(self, path, generations, packed=False):
+        """Write the space-time diagram to a .npy file on disk.
+
+        Row 0 of the file is the current row, followed by the next
+        `generations` rows. The file is memory-mapped and filled row by row,
+        so diagrams much bigger than the available memory can be written.
+
+        Args:
+            path: Name of the .npy file to create.
+            generations: Number of rows to compute after the current one.
+            packed: Store 8 cells per byte (np.packbits with
+                bitorder="little") instead of one uint8 per cell.
+        Returns:
+            The memory-mapped array, opened in read mode.
+        """
+        columns = (self.width + 7) // 8 if packed else self.width
+        diagram = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.uint8, shape=(generations + 1, columns)
+        )
+        diagram[0] = row_to_array(self.current_bits(), self.width, packed)
+        rows = self.generations()
+        for t in range(1, generations + 1):
+            diagram[t] = row_to_array(next(rows), self.width, packed)
+        diagram.flush()
+        del diagram
+        return np.load(path, mmap_mode="r")
+
+    def save_checkpoint(self, path):
+        """Save the automaton to a .npz file (see shared/checkpoint.py).
+
+        The file has the parameters, the generation, the current row, the
+        board (one byte per cell), the packed row of the packed engines and
+        the random generators. The hashlife cache is not saved, it fills
+        up again as the model runs.
+        """
+        board = self.board()
+        row = np.zeros(0, dtype=np.uint8)
+        if self.engine in ("packed", "hashlife"):
+            row = row_to_array(self.row_bits, self.width, packed=True)
+
+        checkpoint.write(
+            path,
+            self,
+            {"width": self.width, "height": self.height, "rule": self.rule, "engine": self.engine,
+             "headless": self.grid is None, "mode": self.mode, "life_rule": self.life_rule,
+             "incremental": self.incremental},
+            generation=np.array(self.generation, dtype=np.int64),
+            current_row=np.array(self.current_row, dtype=np.int64),
+            board=board,
+            row=row,
+        )
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """Create a model from a file written by save_checkpoint().
+
+        The model is built empty with the saved parameters and the states
+        are copied from the file, so the run continues from the saved
+        generation without computing the previous ones.
+        """
+        header, arrays = checkpoint.read(path, cls)
+        model = cls(initial_fraction_alive=0, **header["params"])
+        model.generation = int(arrays["generation"])
+        model.current_row = int(arrays["current_row"])
+        board = arrays["board"]
+
+        if model.engine in ("packed", "hashlife"):
+            model.row_bits = int.from_bytes(arrays["row"].tobytes(), "little")
+            model._rows = model.generations()
+            if model.grid is not None:
+                # The empty model only drew the top row
+                model.states[model.current_row:] = board[model.current_row:]
+        elif model.engine in ("numpy", "parallel"):
+            model.states[...] = board
+        else:
+            for (x, y), agent in model.cell_grid.items():
+                agent.state = int(board[y, x])
+            if model.incremental:
+                model._reset_dirty()
+
+        checkpoint.restore(model, header, arrays)
+        return model
+
+    def close(self):
+        """Stop the worker processes of the parallel engine and free their shared memory.
+
+        The board can still be read, but the model can't step any more. The
+        other engines have nothing to close. Don't leave it to the garbage
+        collector: Mesa keeps every model with agents in Agent._ids, so a
+        model whose cell_grid was read is never collected.
+        """
+        if self.tiles is not None:
+            self.tiles.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def step(self):
         """ Moves a row for every step. Each step updates the next row based on
         los 3 vecinos de la fila anterior usando la tabla de reglas dada.
 
-        Main Rule (Where 1 = Alive, 0 = Dead):
+        Main Rule (Where 1 = Alive, 0 = Dead): self.rule_table, rule 90 by default.
         It stops when the last row is reached (height = 0).
+
+        In the life mode every cell of the board is updated at once instead.
         """
+        with self.profiler.phase("step"):
+            if self.engine in ("packed", "hashlife"):
+                self._step_packed()
+            elif self.mode == "life":
+                self._step_life()
+            else:
+                self._step_rows()
+
+    def _step_rows(self):
+        """Compute the next row with the Cell agents."""
+        profiler = self.profiler
+
         # Get grid dimensions so that it doesn't spawn outside the grid
         width = self.grid.width
 
@@ -62,30 +488,193 @@ class ConwaysGameOfLife(Model):
         prev_row = self.current_row
         next_row = prev_row - 1
 
-        # Para cada columna calculamos el estado de la celda en la fila siguiente
-        for x in range(width):
-            left_position = ((x - 1) % width, prev_row)
-            center_position = (x, prev_row)
-            right_position = ((x + 1) % width, prev_row)
+        if self.incremental:
+            with profiler.phase("compute"):
+                self._step_rows_incremental(prev_row, next_row)
+            self._record_row(next_row)
+            self.current_row = next_row
+            self.generation += 1
+            return
+
+        with profiler.phase("compute"):
+            # Para cada columna calculamos el estado de la celda en la fila siguiente
+            for x in range(width):
+                left_position = ((x - 1) % width, prev_row)
+                center_position = (x, prev_row)
+                right_position = ((x + 1) % width, prev_row)
 
-            left_agent = self.cell_grid[left_position]
-            center_agent = self.cell_grid[center_position]
-            right_agent = self.cell_grid[right_position]
+                left_agent = self.cell_grid[left_position]
+                center_agent = self.cell_grid[center_position]
+                right_agent = self.cell_grid[right_position]
 
-            # We pass the state (0 or 1) of the three neighbors above to determine if the cell is alive or dead
-            next_position = (x, next_row)
-            next_agent = self.cell_grid[next_position]
+                # We pass the state (0 or 1) of the three neighbors above to determine if the cell is alive or dead
+                next_position = (x, next_row)
+                next_agent = self.cell_grid[next_position]
+
+                next_agent.set_next_state(
+                    left_agent.state,
+                    center_agent.state,
+                    right_agent.state,
+                )
+
+        with profiler.phase("assume_state"):
+            # Ahora aplicamos los next_state en la fila siguiente
+            for x in range(width):
+                next_agent = self.cell_grid[(x, next_row)]
+                next_agent.assume_state()
+        self._record_row(next_row)
+
+        # Mark the next row as the current row
+        self.current_row = next_row
+        self.generation += 1
 
+    def advance(self, generations):
+        """Advance the automaton a number of generations.
+
+        With the hashlife engine the row jumps there directly and, if there
+        is a grid, it is drawn as the next row, so every row of the grid can
+        be billions of generations apart. The other engines just step that
+        many times, except the parallel engine, which runs all of them in
+        its workers without coming back to the model.
+        """
+        if generations < 0:
+            raise ValueError(f"Can't advance a negative number of generations, got {generations}")
+        if self.engine == "parallel":
+            self._advance_tiles(generations)
+            self.generation += generations
+            return
+        if self.engine != "hashlife":
+            for _ in range(generations):
+                self.step()
+            return
+
+        if self.grid is not None and self.current_row <= 0:
+            self.running = False
+            return
+
+        row = [(self.row_bits >> x) & 1 for x in range(self.width)]
+        row = self.hashlife.advance(row, generations)
+        self.row_bits = sum(state << x for x, state in enumerate(row))
+        # The generator continues from the new row
+        self._rows = self.generations()
+        self.generation += generations
+
+        if self.grid is not None:
+            self.current_row -= 1
+            self.draw_row(self.current_row)
+
+    def _step_rows_incremental(self, prev_row, next_row):
+        """Compute the next row evaluating only the columns in self._dirty.
+
+        A column whose three cells above are the same as one row before gets
+        the same state as the cell above, so it is copied instead (only the
+        alive ones, the new row starts dead). The cost of a step grows with
+        the number of alive and changing cells instead of the width.
+        """
+        width = self.width
+        cell_grid = self.cell_grid
+        alive = set()
+        changed = set()
+
+        for x in self._dirty:
+            center_agent = cell_grid[(x, prev_row)]
+            next_agent = cell_grid[(x, next_row)]
             next_agent.set_next_state(
-                left_agent.state,
+                cell_grid[((x - 1) % width, prev_row)].state,
                 center_agent.state,
-                right_agent.state,
+                cell_grid[((x + 1) % width, prev_row)].state,
             )
-        
-        # Ahora aplicamos los next_state en la fila siguiente
-        for x in range(width):
-            next_agent = self.cell_grid[(x, next_row)]
-            next_agent.assume_state()
+            if next_agent.state == Cell.ALIVE:
+                alive.add(x)
+            if next_agent.state != center_agent.state:
+                changed.add(x)
 
-        # Mark the next row as the current row
-        self.current_row = next_row
\ No newline at end of file
+        for x in self._alive - self._dirty:
+            cell_grid[(x, next_row)].state = Cell.ALIVE
+            alive.add(x)
+
+        self._alive = alive
+        self._dirty = {(x + dx) % width for x in changed for dx in (-1, 0, 1)}
+
+    def _step_life_incremental(self):
+        """Update only the cells in self._dirty, for the life mode.
+
+        Same idea as the rows mode: a cell with the same 3x3 block as in the
+        last step keeps its state, so only the cells around a change are
+        evaluated in the next step.
+        """
+        for agent in self._dirty:
+            agent.determine_state()
+
+        dirty = set()
+        changes = self.changes
+        for agent in self._dirty:
+            if agent._next_state != agent.state:
+                dirty.add(agent)
+                dirty.update(agent.neighbors)
+                if changes is not None:
+                    changes.add(agent.pos)
+            agent.assume_state()
+        self._dirty = dirty
+
+    def _advance_tiles(self, generations):
+        """Run generations of the life mode in the workers of the parallel engine."""
+        old = self.states.copy() if self.changes is not None else None
+        self.tiles.advance(generations)
+        if old is not None:
+            self._record_flips(old)
+
+    def _step_packed(self):
+        """Take the next row from the generator and draw it if there is a grid."""
+        profiler = self.profiler
+        if self.grid is None:
+            with profiler.phase("compute"):
+                self.row_bits = next(self._rows)
+            self.generation += 1
+            return
+
+        if self.current_row <= 0:
+            self.running = False
+            return
+
+        with profiler.phase("compute"):
+            self.row_bits = next(self._rows)
+        self.generation += 1
+        self.current_row -= 1
+        with profiler.phase("draw"):
+            self.draw_row(self.current_row)
+
+    def _step_life(self):
+        """Advance the whole board one generation of the life rule."""
+        profiler = self.profiler
+        self.generation += 1
+        if self.incremental:
+            with profiler.phase("compute"):
+                self._step_life_incremental()
+            return
+        if self.engine == "parallel":
+            with profiler.phase("compute"):
+                self._advance_tiles(1)
+            return
+        if self.engine == "agents":
+            # Compute every next state before changing any of them
+            with profiler.phase("compute"):
+                self.agents.do("determine_state")
+            with profiler.phase("assume_state"):
+                if self.changes is not None:
+                    self.changes.update(agent.pos for agent in self.agents if agent._next_state != agent.state)
+                self.agents.do("assume_state")
+            return
+
+        # Sum of each 3x3 block: first the column of 3, then the row of 3.
+        # np.roll wraps around, like the torus of the grid
+        with profiler.phase("compute"):
+            states = self.states
+            old = states.copy() if self.changes is not None else None
+            column = np.roll(states, 1, axis=0) + states + np.roll(states, -1, axis=0)
+            block = np.roll(column, 1, axis=1) + column + np.roll(column, -1, axis=1)
+            # The block includes the cell itself, so state * 9 + neighbors is
+            # state * 8 + block. Write in place for the CellView agents
+            np.take(self._life_array, (states << 3) + block, out=states)
+            if old is not None:
+                self._record_flips(old)
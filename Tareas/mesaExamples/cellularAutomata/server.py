@@ -1,22 +1,52 @@
-from game_of_life.model import ConwaysGameOfLife
-from mesa.visualization import (
-    SolaraViz,
-    make_space_component,
-)
+from game_of_life.model import ConwaysGameOfLife, ENGINES
+from shared.canvas import DeltaView
+from shared.raster import board_png, cell_state
+from shared.runner import FastForward, close_replaced
+import solara
+from mesa.visualization import SolaraViz
+from mesa.visualization.utils import update_counter
 
-from mesa.visualization.components import AgentPortrayalStyle
+@solara.component
+def BoardImage(model):
+    """The whole board as a single image (alive cells in black), redrawn every step."""
+    update_counter.get()
+    board = model.board()
+    if not board.size:
+        solara.Markdown("A headless model has no board to draw.")
+        return
+    solara.Image(board_png(board))
 
-def agent_portrayal(agent):
-    return AgentPortrayalStyle(
-        color="white" if agent.state == 0 else "black",
-        marker="s",
-        size=30,
-    )
+# Dead cells in white and alive cells in black
+PALETTE = [(255, 255, 255, 255), (0, 0, 0, 255)]
+
+@solara.component
+def BoardDelta(model):
+    """The board with one pixel per cell, sending only the flipped cells in every frame (see shared/canvas.py)."""
+    if model.grid is None and model.states is None:
+        solara.Markdown("A headless model has no board to draw.")
+        return
+    DeltaView(model, lambda model: model.board(), cell_state, PALETTE)
 
-def post_process(ax):
-    ax.set_aspect("equal")
-    ax.set_xticks([])
-    ax.set_yticks([])
+@solara.component
+def ProfilePanel(model):
+    """Time of each phase of the step (see shared/profiler.py), updated every step."""
+    update_counter.get()
+    if not model.profiler.enabled:
+        solara.Markdown("Turn on *Profile phases* to time the phases of the step.")
+        return
+    solara.Markdown(model.profiler.table())
+
+class PageGameOfLife(ConwaysGameOfLife):
+    """
+    The model of the page. SolaraViz can't change the options of the engine
+    Select when the mode changes, so it offers the engines of every mode,
+    and an engine the mode doesn't have runs the first engine of the mode
+    instead of raising ValueError.
+    """
+    def __init__(self, mode="rows", engine="agents", **kwargs):
+        if mode in ENGINES and engine not in ENGINES[mode]:
+            engine = ENGINES[mode][0]
+        super().__init__(mode=mode, engine=engine, **kwargs)
 
 model_params = {
     "seed": {
@@ -29,7 +59,7 @@ model_params = {
         "value": 50,
         "label": "Width",
         "min": 5,
-        "max": 60,
+        "max": 1000,
         "step": 1,
     },
     "height": {
@@ -37,7 +67,7 @@ model_params = {
         "value": 50,
         "label": "Height",
         "min": 5,
-        "max": 60,
+        "max": 1000,
         "step": 1,
     },
     "initial_fraction_alive": {
@@ -48,20 +78,52 @@ model_params = {
         "max": 1,
         "step": 0.01,
     },
+    "rule": {
+        "type": "SliderInt",
+        "value": 90,
+        "label": "Wolfram rule",
+        "min": 0,
+        "max": 255,
+        "step": 1,
+    },
+    "mode": {
+        "type": "Select",
+        "value": "rows",
+        "values": list(ENGINES),
+        "label": "Mode",
+    },
+    "life_rule": {
+        "type": "InputText",
+        "value": "B3/S23",
+        "label": "Life rule (B/S)",
+    },
+    "engine": {
+        "type": "Select",
+        "value": "agents",
+        "values": list(dict.fromkeys(engine for engines in ENGINES.values() for engine in engines)),
+        "label": "Engine (" + ", ".join(f"{mode}: {'/'.join(engines)}" for mode, engines in ENGINES.items())
+                 + "; others run the first one)",
+    },
+    "profile": {
+        "type": "Checkbox",
+        "value": False,
+        "label": "Profile phases",
+    },
 }
 
-# Create initial model instance
-gof_model = ConwaysGameOfLife()
+# Create initial model instance, reactive so the page can see it replaced
+gof_model = solara.reactive(PageGameOfLife())
 
-space_component = make_space_component(
-        agent_portrayal,
-        draw_grid = False,
-        post_process=post_process
-)
+@solara.component
+def Page():
+    # Close the model that the reset button or a new parameter replaces,
+    # which stops the worker processes of the parallel engine
+    solara.use_effect(lambda: close_replaced(gof_model), [])
+    SolaraViz(
+        gof_model,
+        components=[BoardDelta, FastForward, ProfilePanel, (BoardImage, 1)],
+        model_params=model_params,
+        name="Game of Life",
+    )
 
-page = SolaraViz(
-    gof_model,
-    components=[space_component],
-    model_params=model_params,
-    name="Game of Life",
-)
+page = Page
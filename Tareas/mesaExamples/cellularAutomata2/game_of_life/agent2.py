@@ -54,23 +54,58 @@ class Cell(FixedAgent):
 
     # Calculate next state only from the 3 neighbors in the upper row
     def set_next_state(self, left_state, center_state, right_state):
-        # Ensure values are 0 or 1 for simplicity
-        a = 1 if left_state == self.ALIVE else 0
-        b = 1 if center_state == self.ALIVE else 0
-        c = 1 if right_state == self.ALIVE else 0
-        pattern = f"{a}{b}{c}"
-
-        if pattern in ["110", "100", "011", "001"]: # Alive patterns
-            self._next_state = self.ALIVE
-        else:
-            self._next_state = self.DEAD
-
-        self.state = self._next_state
-        self._next_state = None
+        """Look up the next state in the rule table compiled by the model.
+
+        The (left, center, right) pattern read as a binary number is the index
+        of the table, e.g. 110 -> 6.
+        """
+        pattern = (left_state << 2) | (center_state << 1) | right_state
+        self._next_state = self.model.rule_table[pattern]
+        # The state is applied later in assume_state(), so the neighbors to the
+        # right still read this cell's current state
 
     # Updates the cell's state to the next computed state
     def assume_state(self):
         """Set the state to the new computed state -- computed in step()."""
         if self._next_state is not None:
             self.state = self._next_state
-            self._next_state = None
\ No newline at end of file
+            self._next_state = None
+
+
+class CellView(Cell):
+    """Cell whose state is read from the model's state array.
+
+    Used by the array engines: the model owns the states and the agents
+    only exist for the code that reads model.cell_grid (see CellViews).
+    """
+
+    @property
+    def state(self):
+        x, y = self.pos
+        return int(self.model.states[y, x])
+
+    @state.setter
+    def state(self, value):
+        x, y = self.pos
+        self.model.states[y, x] = value
+
+
+class CellViews(dict):
+    """The cell_grid of the array engines.
+
+    The CellView of a position is made the first time it is looked up, so
+    a large board doesn't build an agent per cell that nobody reads (the
+    pages draw from model.board()).
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def __missing__(self, position):
+        model = self.model
+        x, y = position
+        if not (0 <= x < model.width and 0 <= y < model.height):
+            raise KeyError(position)
+        view = self[position] = CellView(model, model.grid[position], init_state=int(model.states[y, x]))
+        return view
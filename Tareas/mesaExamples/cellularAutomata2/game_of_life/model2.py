@@ -1,15 +1,99 @@
+import numpy as np
 from mesa import Model
 from mesa.discrete_space import OrthogonalMooreGrid
-from .agent import Cell
+from .agent2 import Cell, CellViews
+from shared.boards import random_board
+from shared.hashlife import HashLife
+from shared.parallel import TiledStepper
+from shared import checkpoint
+from shared.profiler import Profiler
+
+ENGINES = ("agents", "numpy", "hashlife", "parallel")
+
+
+def compile_rule(rule):
+    """Return the lookup table of a Wolfram rule number (0 to 255).
+
+    Entry i of the table is the next state of a cell whose (left, center,
+    right) pattern is i in binary, which is bit i of the rule number.
+    Rule 90 gives 001, 011, 100 and 110 as the alive patterns.
+    """
+    rule = int(rule)
+    if not 0 <= rule <= 255:
+        raise ValueError(f"Rule must be between 0 and 255, got {rule}")
+    return tuple((rule >> pattern) & 1 for pattern in range(8))
 
 
 class ConwaysGameOfLife(Model):
-    """Represents the 2-dimensional array of cells in an Elementary Cellular Automaton."""
+    """Represents the 2-dimensional array of cells in an Elementary Cellular Automaton.
 
-    def __init__(self, width=50, height=50, initial_fraction_alive=0.2, seed=None):
+    Args:
+        engine: "agents" updates every Cell agent one by one, "numpy" keeps the
+            states in a single array and updates the whole grid at once. Both
+            give the same result for the same seed. "hashlife" keeps the same
+            array but advance() jumps many generations at once with a
+            memoized tree of the rows (see shared/hashlife.py); rows that
+            don't repeat are stepped packed in an int. "parallel" splits
+            the rows of the array among `workers` processes that share it
+            (see shared/parallel.py), for very large grids.
+        rule: Wolfram rule number from 0 to 255 (90 by default).
+        incremental: Only for the agents engine. Evaluate only the cells whose
+            neighborhood changed in the last step; the rest keep their state.
+        headless: Not for the agents engine. Don't build the grid nor any
+            Cell agent, the states only live in self.states.
+        profile: Time the phases of every step in self.profiler (see
+            shared/profiler.py), like the compute and assume_state passes.
+        workers: Processes of the parallel engine, one per core by default.
+            They run until close() (the model is also a context manager).
+    """
+
+    def __init__(self, width=50, height=50, initial_fraction_alive=0.2, seed=None, engine="agents", rule=90,
+                 incremental=False, headless=False, profile=False, workers=None):
         """Create a new playing area of (width, height) cells."""
         super().__init__(seed=seed)
 
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+        if incremental and engine != "agents":
+            raise ValueError("The incremental mode is only available for the agents engine")
+        if headless and engine == "agents":
+            raise ValueError("The agents engine needs the grid and can't run headless")
+        self.engine = engine
+        self.incremental = incremental
+        self.width = width
+        self.height = height
+
+        # Time of the phases of every step, see shared/profiler.py
+        self.profiler = Profiler(enabled=profile)
+
+        # Cells that changed since the last take_changes(), see that method
+        self.changes = None
+
+        # Compile the rule once: a tuple for the agents and an array for numpy
+        self.rule = int(rule)
+        self.rule_table = compile_rule(rule)
+        self._rule_array = np.array(self.rule_table, dtype=np.uint8)
+        self.hashlife = HashLife(self.rule_table) if engine == "hashlife" else None
+
+        # States of the numpy and hashlife engines, one byte per cell indexed
+        # as states[y, x] (position y * width + x of the flat buffer). The
+        # agents engine only uses it to start its Cell agents. The parallel
+        # engine draws them straight into the memory shared with its workers
+        self.tiles = None
+        if engine == "parallel":
+            self.tiles = TiledStepper((height, width), "rows", self.rule_table, workers)
+            self.states = self._random_states(initial_fraction_alive, out=self.tiles.board)
+        else:
+            self.states = self._random_states(initial_fraction_alive)
+
+        # Maintain references to agents by position for direct access
+        self.cell_grid = {}
+
+        self.grid = None
+        if headless:
+            self.running = True
+            return
+
         """Grid where cells are connected to their 8 neighbors.
 
         Example for two dimensions:
@@ -22,56 +106,269 @@ class ConwaysGameOfLife(Model):
         self.grid = OrthogonalMooreGrid((width, height), capacity=1, torus=True)
         # Torus means that the edges are connected so they always have 8 neighbors
 
-        # Maintain references to agents by position for direct access
-        self.cell_grid = {}
+        # The agents engine keeps the states in its Cell agents. The other
+        # engines only make a CellView that reads self.states when a cell
+        # of cell_grid is looked up
+        if engine != "agents":
+            self.cell_grid = CellViews(self)
+            self.running = True
+            return
 
-        # Initialize cells in all rows with random states
+        states = self.states
+        self.states = None
         for cell in self.grid.all_cells:
             x, y = cell.coordinate
-            init_state = (
-                Cell.ALIVE
-                if self.random.random() < initial_fraction_alive
-                else Cell.DEAD
-            )
             self.cell_grid[(x, y)] = Cell(
-                self,  
-                cell,  
-                init_state=init_state,
+                self,
+                cell,
+                init_state=int(states[y, x]),
             )
 
+        if incremental:
+            self._dirty = self._initial_dirty()
+
         self.running = True
 
+    def _random_states(self, initial_fraction_alive, out=None):
+        """Return the random initial states of all cells.
+
+        The numbers are drawn in the order of grid.all_cells (column by
+        column), which is the order the Cell agents used to draw them, so
+        every engine starts from the same grid for the same seed. They go
+        a few columns at a time straight into the uint8 array (or `out`),
+        see shared/boards.py.
+        """
+        return random_board(self.random, self.width, self.height, initial_fraction_alive, out)
+
+    def _initial_dirty(self):
+        """Return the positions that have to be evaluated in the first step.
+
+        It only looks at the current states, so it also works for a grid
+        loaded from a checkpoint.
+
+        When the rule keeps 000 dead, a cell whose three cells are dead
+        already has the state the rule gives it, so only the alive cells and
+        their left and right neighbors can change.
+        """
+        if self.rule_table[0]:
+            return set(self.cell_grid)
+        width = self.width
+        dirty = set()
+        for (x, y), agent in self.cell_grid.items():
+            if agent.state == Cell.ALIVE:
+                dirty.update((((x - 1) % width, y), (x, y), ((x + 1) % width, y)))
+        return dirty
+
+    def board(self):
+        """Return the states of all cells as a (height, width) uint8 array.
+
+        Indexed as board[y, x]. The numpy and hashlife engines return their
+        own array, the agents engine reads every Cell agent.
+        """
+        if self.states is not None:
+            return self.states
+        board = np.zeros((self.height, self.width), dtype=np.uint8)
+        for (x, y), agent in self.cell_grid.items():
+            board[y, x] = agent.state
+        return board
+
+    def take_changes(self):
+        """Return the (x, y) of the cells that changed since the last call.
+
+        The first call returns None, meaning everything has to be drawn,
+        and turns the recording on; the steps only record while someone
+        takes the changes, so a model without a view doesn't pay for it.
+        """
+        changes = self.changes
+        self.changes = set()
+        return changes
+
+    def _record_flips(self, old):
+        """Record the cells of self.states that differ from the old copy."""
+        ys, xs = np.nonzero(self.states != old)
+        self.changes.update(zip(xs.tolist(), ys.tolist()))
+
+    def save_checkpoint(self, path):
+        """Save the automaton to a .npz file (see shared/checkpoint.py).
+
+        The file has the parameters, the states of all cells (one byte per
+        cell) and the random generators. The hashlife cache is not saved,
+        it fills up again as the model runs.
+        """
+        checkpoint.write(
+            path,
+            self,
+            {"width": self.width, "height": self.height, "engine": self.engine, "rule": self.rule,
+             "incremental": self.incremental, "headless": self.grid is None},
+            board=self.board(),
+        )
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """Create a model from a file written by save_checkpoint().
+
+        The model is built empty with the saved parameters and the states
+        are copied from the file, so the run continues from the saved step
+        without computing the previous ones.
+        """
+        header, arrays = checkpoint.read(path, cls)
+        model = cls(initial_fraction_alive=0, **header["params"])
+        board = arrays["board"]
+        if model.states is not None:
+            model.states[...] = board
+        else:
+            for (x, y), agent in model.cell_grid.items():
+                agent.state = int(board[y, x])
+            if model.incremental:
+                model._dirty = model._initial_dirty()
+
+        checkpoint.restore(model, header, arrays)
+        return model
+
+    def close(self):
+        """Stop the worker processes of the parallel engine and free their shared memory.
+
+        The board can still be read, but the model can't step any more. The
+        other engines have nothing to close. Don't leave it to the garbage
+        collector: Mesa keeps every model with agents in Agent._ids, so a
+        model whose cell_grid was read is never collected.
+        """
+        if self.tiles is not None:
+            self.tiles.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def step(self):
         """Updates all cells simultaneously based on their 3 neighbors (left, center, right).
         This runs infinitely until the simulation is paused.
-        
+
         Main Rule (Where 1 = Alive, 0 = Dead):
-        Each cell's next state is determined by its left neighbor, itself, and right neighbor.
+        Each cell's next state is determined by its left neighbor, itself, and right neighbor,
+        looked up in self.rule_table.
         """
+        profiler = self.profiler
+        with profiler.phase("step"):
+            if self.engine == "agents" and not self.incremental:
+                self._step_agents()
+            else:
+                with profiler.phase("compute"):
+                    if self.engine == "numpy":
+                        self._step_numpy()
+                    elif self.engine in ("hashlife", "parallel"):
+                        self.advance(1)
+                    else:
+                        self._step_incremental()
+
+    def _step_agents(self):
+        """Update every Cell agent: first all the next states, then apply them."""
+        profiler = self.profiler
+
         # Get grid dimensions so that it doesn't spawn outside the grid
-        width = self.grid.width
-        height = self.grid.height
-
-        # Calculate next states for ALL cells based on current states
-        for y in range(height):
-            for x in range(width):
-                left_position = ((x - 1) % width, y)
-                center_position = (x, y)
-                right_position = ((x + 1) % width, y)
-
-                left_agent = self.cell_grid[left_position]
-                center_agent = self.cell_grid[center_position]
-                right_agent = self.cell_grid[right_position]
-
-                # Calculate next state for this/exact cell
-                center_agent.set_next_state(
-                    left_agent.state,
-                    center_agent.state,
-                    right_agent.state,
-                )
-        
-        # Apply all next_state changes simultaneously to all cells
-        for y in range(height):
-            for x in range(width):
-                agent = self.cell_grid[(x, y)]
-                agent.assume_state()
\ No newline at end of file
+        width = self.width
+        height = self.height
+
+        with profiler.phase("compute"):
+            # Calculate next states for ALL cells based on current states
+            for y in range(height):
+                for x in range(width):
+                    left_position = ((x - 1) % width, y)
+                    center_position = (x, y)
+                    right_position = ((x + 1) % width, y)
+
+                    left_agent = self.cell_grid[left_position]
+                    center_agent = self.cell_grid[center_position]
+                    right_agent = self.cell_grid[right_position]
+
+                    # Calculate next state for this/exact cell
+                    center_agent.set_next_state(
+                        left_agent.state,
+                        center_agent.state,
+                        right_agent.state,
+                    )
+
+        with profiler.phase("assume_state"):
+            # Apply all next_state changes simultaneously to all cells
+            changes = self.changes
+            for y in range(height):
+                for x in range(width):
+                    agent = self.cell_grid[(x, y)]
+                    if changes is not None and agent._next_state != agent.state:
+                        changes.add((x, y))
+                    agent.assume_state()
+
+    def advance(self, generations):
+        """Advance the automaton a number of generations.
+
+        The hashlife engine jumps there directly, every row is a separate
+        ring and all of them share the same cache. The result is written to
+        self.states, so the Cell agents show the new generation. The
+        parallel engine runs all the generations in its workers without
+        coming back to the model. The other engines just step that many
+        times.
+        """
+        if generations < 0:
+            raise ValueError(f"Can't advance a negative number of generations, got {generations}")
+        if self.engine not in ("hashlife", "parallel"):
+            for _ in range(generations):
+                self.step()
+            return
+
+        old = self.states.copy() if self.changes is not None else None
+        if self.engine == "parallel":
+            self.tiles.advance(generations)
+        else:
+            for y in range(self.height):
+                self.states[y] = self.hashlife.advance(self.states[y].tolist(), generations)
+        if old is not None:
+            self._record_flips(old)
+
+    def _step_incremental(self):
+        """Update only the cells in self._dirty.
+
+        A cell whose left, center and right states didn't change in the last
+        step would get the same state as last time, which is its current
+        state, so it can be skipped. The cost of a step grows with the number
+        of cells that change instead of width * height.
+        """
+        width = self.width
+        cell_grid = self.cell_grid
+
+        for x, y in self._dirty:
+            cell_grid[(x, y)].set_next_state(
+                cell_grid[((x - 1) % width, y)].state,
+                cell_grid[(x, y)].state,
+                cell_grid[((x + 1) % width, y)].state,
+            )
+
+        # Apply the new states and mark the neighborhoods of the changed cells
+        dirty = set()
+        changes = self.changes
+        for x, y in self._dirty:
+            agent = cell_grid[(x, y)]
+            if agent._next_state != agent.state:
+                dirty.update((((x - 1) % width, y), (x, y), ((x + 1) % width, y)))
+                if changes is not None:
+                    changes.add((x, y))
+            agent.assume_state()
+        self._dirty = dirty
+
+    def _step_numpy(self):
+        """Apply the rule to every row at once.
+
+        Shifting the rows one column to the right/left gives the left/right
+        neighbor of every cell (np.roll wraps around like the torus), and the
+        pattern of each cell is used as an index into the rule table.
+        """
+        states = self.states
+        old = states.copy() if self.changes is not None else None
+        left = np.roll(states, 1, axis=1)
+        right = np.roll(states, -1, axis=1)
+        pattern = (left << 2) | (states << 1) | right
+        # Write in place so the CellView agents keep reading the same array
+        np.take(self._rule_array, pattern, out=states)
+        if old is not None:
+            self._record_flips(old)
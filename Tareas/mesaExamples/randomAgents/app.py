@@ -1,48 +1,154 @@
-from random_agents.agent import BorderAgent, ChargingStationAgent, DirtAgent, RandomAgent, ObstacleAgent
+import weakref
+
+from random_agents.agent import (
+    BORDER, DIRT, OBSTACLE, STATION,
+    BorderAgent, ChargingStationAgent, DirtAgent, RandomAgent, ObstacleAgent,
+)
+from shared.canvas import DeltaView
 from random_agents.model import RandomModel
+from shared.runner import FastForward
 
+import solara
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+import numpy as np
 from mesa.visualization import (
     Slider,
     SolaraViz,
-    make_space_component,
     make_plot_component,
 )
 
 from mesa.visualization.components import AgentPortrayalStyle
+from mesa.visualization.utils import update_counter
 
-def random_portrayal(agent):
-    if agent is None:
-        return
+# Estilo de cada tipo de agente, creado una sola vez en lugar de uno por
+# agente en cada frame
+STYLES = {
+    RandomAgent: AgentPortrayalStyle(color="red", marker="o", size=50),
+    ObstacleAgent: AgentPortrayalStyle(color="gray", marker="s", size=100),
+    DirtAgent: AgentPortrayalStyle(color="brown", marker="d", size=50),
+    BorderAgent: AgentPortrayalStyle(color="black", marker="s", size=100),
+    ChargingStationAgent: AgentPortrayalStyle(color="blue", marker="P", size=70),
+}
+
+# Fondo de cada modelo, ver background()
+_backgrounds = weakref.WeakKeyDictionary()
+
+
+def background(model):
+    """
+    Returns the static layer of a model: an RGBA image with the borders
+    and obstacles, and the positions of the charging stations. None of
+    them move, so it is built the first time and reused in every frame.
+    """
+    layer = _backgrounds.get(model)
+    if layer is None:
+        image = np.zeros((model.height, model.width, 4))
+        for agent_type in (BorderAgent, ObstacleAgent):
+            color = to_rgba(STYLES[agent_type].color)
+            for agent in model.agents_by_type.get(agent_type, []):
+                x, y = agent.cell.coordinate
+                image[y, x] = color
+        stations = [agent.cell.coordinate for agent in model.agents_by_type.get(ChargingStationAgent, [])]
+        layer = _backgrounds[model] = (image, stations)
+    return layer
 
-    portrayal = AgentPortrayalStyle(
-        size=50,
-        marker="o",
-    )
-
-    if isinstance(agent, RandomAgent):
-        portrayal.color = "red"
-    elif isinstance(agent, ObstacleAgent):
-        portrayal.color = "gray"
-        portrayal.marker = "s"
-        portrayal.size = 100
-    elif isinstance(agent, DirtAgent):
-        portrayal.color = "brown"
-        portrayal.marker = "d"
-        portrayal.size = 50
-    elif isinstance(agent, BorderAgent):
-        portrayal.color = "black"
-        portrayal.marker = "s"
-        portrayal.size = 100
-    elif isinstance(agent, ChargingStationAgent):
-        portrayal.color = "blue"
-        portrayal.marker = "P"
-        portrayal.size = 70
-
-    return portrayal
 
 def post_process(ax):
     ax.set_aspect("equal")
 
+
+@solara.component
+def FloorView(model):
+    """
+    The floor: the static background as one image, then one scatter per
+    type for the stations, the dirt left and the robots. Only the robots
+    and the dirt are looked up in every frame.
+    """
+    update_counter.get()
+    image, stations = background(model)
+    robots = [
+        agent.cell.coordinate
+        for agent_type, agents in model.agents_by_type.items()
+        if issubclass(agent_type, RandomAgent)
+        for agent in agents
+    ]
+    dirt = [cell.coordinate for cell in model.dirt_index]
+
+    fig = Figure()
+    ax = fig.add_subplot()
+    extent = (-0.5, model.width - 0.5, -0.5, model.height - 0.5)
+    ax.imshow(image, origin="lower", extent=extent, interpolation="nearest")
+    for agent_type, positions in ((ChargingStationAgent, stations), (DirtAgent, dirt), (RandomAgent, robots)):
+        if positions:
+            style = STYLES[agent_type]
+            x, y = zip(*positions)
+            ax.scatter(x, y, c=style.color, marker=style.marker, s=style.size)
+    ax.set_xlim(extent[:2])
+    ax.set_ylim(extent[2:])
+    post_process(ax)
+    solara.FigureMatplotlib(fig, format="png", bbox_inches="tight")
+
+
+# Colores del DeltaView: el índice 0 es el piso vacío y cada tipo de agente
+# tiene el suyo, en el orden en que se dibujan uno encima de otro
+LAYERS = [BorderAgent, ObstacleAgent, ChargingStationAgent, DirtAgent, RandomAgent]
+PALETTE = [(255, 255, 255, 255)] + [
+    tuple(round(channel * 255) for channel in to_rgba(STYLES[agent_type].color)) for agent_type in LAYERS
+]
+ROBOT_INDEX = LAYERS.index(RandomAgent) + 1
+# Bit de model.cell_flags de cada tipo fijo, con su índice
+FLAG_INDICES = [(BORDER, 1), (OBSTACLE, 2), (STATION, 3), (DIRT, 4)]
+
+
+def flags_index(flags):
+    """Palette index of a cell without robots, from its cell_flags."""
+    index = 0
+    for flag, flag_index in FLAG_INDICES:
+        if flags & flag:
+            index = flag_index
+    return index
+
+
+def floor_indices(model):
+    """Palette index of every cell of the floor, indexed as [y, x]."""
+    indices = np.zeros((model.height, model.width), dtype=np.uint8)
+    for cell, flags in model.cell_flags.items():
+        x, y = cell.coordinate
+        indices[y, x] = flags_index(flags)
+    for agent_type, agents in model.agents_by_type.items():
+        if issubclass(agent_type, RandomAgent):
+            for agent in agents:
+                x, y = agent.cell.coordinate
+                indices[y, x] = ROBOT_INDEX
+    return indices
+
+
+def floor_index(model, x, y):
+    """Palette index of the cell (x, y)."""
+    cell = model.grid[(x, y)]
+    if any(isinstance(agent, RandomAgent) for agent in cell.agents):
+        return ROBOT_INDEX
+    return flags_index(model.cell_flags.get(cell, 0))
+
+
+@solara.component
+def FloorDelta(model):
+    """
+    The floor with one pixel per cell, sending only the cells where a
+    robot moved or dirt was cleaned in every frame (see shared/canvas.py).
+    """
+    DeltaView(model, floor_indices, floor_index, PALETTE)
+
+@solara.component
+def ProfilePanel(model):
+    """Time of each phase of the step (see shared/profiler.py), updated every step."""
+    update_counter.get()
+    if not model.profiler.enabled:
+        solara.Markdown("Turn on *Profile phases* to time the phases of the step.")
+        return
+    solara.Markdown(model.profiler.table())
+
 model_params = {
     "seed": {
         "type": "InputText",
@@ -51,19 +157,19 @@ model_params = {
     },
     "width": Slider("Grid width", 28, 1, 50),
     "height": Slider("Grid height", 28, 1, 50),
+    "profile": {
+        "type": "Checkbox",
+        "value": False,
+        "label": "Profile phases",
+    },
 }
 
 # Create the model using the initial parameters from the settings
 model = RandomModel(
     width=model_params["width"].value,
     height=model_params["height"].value,
-    seed=model_params["seed"]["value"]
-)
-
-space_component = make_space_component(
-        random_portrayal,
-        draw_grid = False,
-        post_process=post_process
+    seed=model_params["seed"]["value"],
+    profile=model_params["profile"]["value"],
 )
 
 # Crear componentes de gráficas
@@ -77,7 +183,7 @@ plot_component3 = make_plot_component(
 
 page = SolaraViz(
     model,
-    components=[space_component, plot_component, plot_component3],
+    components=[FloorDelta, FastForward, plot_component, plot_component3, ProfilePanel, (FloorView, 1)],
     model_params=model_params,
     name="Random Model",
 )
\ No newline at end of file
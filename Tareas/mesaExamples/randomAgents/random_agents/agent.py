@@ -1,5 +1,13 @@
 from mesa.discrete_space import CellAgent, FixedAgent
 
+# Bits of RandomModel.cell_flags: the kinds of fixed agent in each cell
+BORDER = 1
+OBSTACLE = 2
+DIRT = 4
+STATION = 8
+# Robots can't go through these cells
+BLOCKED = BORDER | OBSTACLE
+
 class RandomAgent(CellAgent):
     """
     Agent that moves randomly.
@@ -9,6 +17,10 @@ class RandomAgent(CellAgent):
         max_energy: Maximum battery capacity
         charging_station: Reference to assigned charging station
         is_charging: Whether the agent is currently charging
+        trash_count, movement_count: Metrics of the robot
+    energy, trash_count and movement_count are properties that also keep
+    the totals of the model (total_energy, total_trash, total_movements)
+    up to date, so the reporters don't have to add them up every step.
     """
     def __init__(self, model, energy=100, cell=None, charging_station=None):
         """
@@ -19,6 +31,11 @@ class RandomAgent(CellAgent):
             charging_station: Assigned charging station for this agent
         """
         super().__init__(model)
+        self._energy = 0
+        self._trash_count = 0
+        self._movement_count = 0
+        model.robot_count += 1
+
         self.max_energy = energy
         self.energy = energy
         self.charging_station = charging_station
@@ -29,6 +46,41 @@ class RandomAgent(CellAgent):
         self.trash_count = 0  # Cantidad de basura recolectada
         self.movement_count = 0  # Total de movimientos realizados
 
+    @property
+    def energy(self):
+        return self._energy
+
+    @energy.setter
+    def energy(self, value):
+        self.model.total_energy += value - self._energy
+        self._energy = value
+
+    @property
+    def trash_count(self):
+        return self._trash_count
+
+    @trash_count.setter
+    def trash_count(self, value):
+        self.model.total_trash += value - self._trash_count
+        self._trash_count = value
+
+    @property
+    def movement_count(self):
+        return self._movement_count
+
+    @movement_count.setter
+    def movement_count(self, value):
+        self.model.total_movements += value - self._movement_count
+        self._movement_count = value
+
+    def remove(self):
+        """Remove the robot and take its values out of the model's totals."""
+        self.model.robot_count -= 1
+        self.model.total_energy -= self._energy
+        self.model.total_trash -= self._trash_count
+        self.model.total_movements -= self._movement_count
+        super().remove()
+
     def move(self):
         """
         Determines the next cell to move to. Prioritizes:
@@ -51,54 +103,38 @@ class RandomAgent(CellAgent):
         
         self.is_charging = False
         
-        # Prefer cells with DirtAgent
-        cells_with_dirt = self.cell.neighborhood.select(
-            lambda cell: any(isinstance(obj, DirtAgent) for obj in cell.agents)
-        )
+        # Prefer cells with DirtAgent, looked up in the model's cell flags
+        cell_flags = self.model.cell_flags
+        with self.model.profiler.phase("neighbors"):
+            cells_with_dirt = [cell for cell in self.cell.neighborhood if cell_flags.get(cell, 0) & DIRT]
         
         # If there are cells with dirt, move to one of them
-        if len(cells_with_dirt) > 0:
-            self.cell = cells_with_dirt.select_random_cell()
+        if cells_with_dirt:
+            self.cell = self.random.choice(cells_with_dirt)
             self.movement_count += 1  # Incrementar contador
         else:
             # Otherwise, move to any empty cell
-            next_moves = self.cell.neighborhood.select(lambda cell: cell.is_empty)
-            if len(next_moves) > 0:
-                self.cell = next_moves.select_random_cell()
+            with self.model.profiler.phase("neighbors"):
+                next_moves = [cell for cell in self.cell.neighborhood if cell.is_empty]
+            if next_moves:
+                self.cell = self.random.choice(next_moves)
                 self.movement_count += 1 
 
     def move_towards_target(self, target_cell):
         """
         Moves one step towards the target cell (charging station)
+        following a shortest path around obstacles and borders
         """
-        current_x, current_y = self.cell.coordinate
-        target_x, target_y = target_cell.coordinate
+        # Next cell of every reachable cell, computed once per target
+        with self.model.profiler.phase("route"):
+            route = self.model.route_to(target_cell)
+        next_cell = route.get(self.cell)
         
-        # Calculate direction
-        dx = target_x - current_x
-        dy = target_y - current_y
-        
-        # Get possible moves in the neighborhood
-        possible_moves = self.cell.neighborhood.select(
-            lambda cell: not any(isinstance(obj, (ObstacleAgent, BorderAgent)) for obj in cell.agents)
-        )
-        
-        if len(possible_moves) == 0:
+        # No path to the target (or already there): stay
+        if next_cell is None:
             return
         
-        # Find the cell that gets us closer to target
-        best_cell = None
-        best_distance = float('inf')
-        
-        for cell in possible_moves.cells:
-            cell_x, cell_y = cell.coordinate
-            distance = abs(target_x - cell_x) + abs(target_y - cell_y)
-            if distance < best_distance:
-                best_distance = distance
-                best_cell = cell
-        
-        if best_cell:
-            self.cell = best_cell
+        self.cell = next_cell
 
     def eat_dirt(self):
         """
@@ -109,8 +145,10 @@ class RandomAgent(CellAgent):
             return
             
         # Check if there's a DirtAgent in the current cell and eat it
-        for agent in list(self.cell.agents):
-            if isinstance(agent, DirtAgent):
+        dirt = self.model.dirt_index.get(self.cell)
+        if dirt:
+            # clean() removes the agent from the index, so iterate over a copy
+            for agent in list(dirt):
                 agent.clean()
                 self.trash_count += 1 
 
@@ -128,17 +166,28 @@ class RandomAgent(CellAgent):
 
     def step(self):
         """
-        Determines the new direction it will take, then moves and eats dirt
+        Determines the new direction it will take, then moves and eats dirt.
+        Each part is a phase of the model's profiler.
         """
+        profiler = self.model.profiler
+        start = self.cell
         if self.is_charging:
             # If charging, just charge and don't move
-            self.charge()
+            with profiler.phase("charge"):
+                self.charge()
         else:
             # Normal behavior: move and clean
-            self.move()
+            with profiler.phase("move"):
+                self.move()
             self.energy -= 1  # Reduce energy after moving
-            self.eat_dirt()
+            with profiler.phase("eat_dirt"):
+                self.eat_dirt()
         
+        # Record the cells to redraw, see RandomModel.take_changes()
+        changes = self.model.changes
+        if changes is not None and (self.cell is not start or self.energy <= 0):
+            changes.update((start.coordinate, self.cell.coordinate))
+
         # Remove agent if energy depleted
         if self.energy <= 0:
             self.remove()
@@ -147,10 +196,18 @@ class RandomAgent(CellAgent):
 class BorderAgent(FixedAgent):
     """
     Border agent. Just to add borders to the grid.
+    Robots can't go through its cell.
     """
+    cell_flag = BORDER
+
     def __init__(self, model, cell):
         super().__init__(model)
         self.cell = cell
+        model.mark_cell(cell, self.cell_flag)
+
+    def remove(self):
+        self.model.unmark_cell(self.cell, self.cell_flag)
+        super().remove()
 
     def step(self):
         pass
@@ -159,10 +216,18 @@ class BorderAgent(FixedAgent):
 class ObstacleAgent(FixedAgent):
     """
     Obstacle agent. Just to add obstacles to the grid.
+    Robots can't go through its cell.
     """
+    cell_flag = OBSTACLE
+
     def __init__(self, model, cell):
         super().__init__(model)
         self.cell = cell
+        model.mark_cell(cell, self.cell_flag)
+
+    def remove(self):
+        self.model.unmark_cell(self.cell, self.cell_flag)
+        super().remove()
 
     def step(self):
         pass
@@ -171,11 +236,17 @@ class ObstacleAgent(FixedAgent):
 class DirtAgent(FixedAgent):
     """
     Dirt agent. Just to add dirt to the grid.
+    It registers itself in model.dirt_index (cell -> dirt agents in it)
+    and marks its cell until it is cleaned.
     """
+    cell_flag = DIRT
+
     def __init__(self, model, cell):
         super().__init__(model)
         self.cell = cell
         self._is_dirty = True
+        model.dirt_index.setdefault(cell, []).append(self)
+        model.mark_cell(cell, self.cell_flag)
     
     @property
     def is_dirty(self):
@@ -189,6 +260,11 @@ class DirtAgent(FixedAgent):
 
     def clean(self):
         self.is_dirty = False
+        dirt = self.model.dirt_index[self.cell]
+        dirt.remove(self)
+        if not dirt:
+            del self.model.dirt_index[self.cell]
+        self.model.unmark_cell(self.cell, self.cell_flag)
         self.cell.remove_agent(self)
 
     def step(self):
@@ -199,10 +275,17 @@ class ChargingStationAgent(FixedAgent):
     """
     Charging Station agent. Recharges assigned robot.
     """
+    cell_flag = STATION
+
     def __init__(self, model, cell, assigned_robot=None):
         super().__init__(model)
         self.cell = cell
         self.assigned_robot = assigned_robot
+        model.mark_cell(cell, self.cell_flag)
+
+    def remove(self):
+        self.model.unmark_cell(self.cell, self.cell_flag)
+        super().remove()
 
     def step(self):
         pass
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""Run the RandomModel without the Solara page, for parameter sweeps.
+
+Every configuration runs in its own process, so a sweep of thousands of
+replications uses every core. Example, from the randomAgents2 folder:
+
+    python -m random_agents.batch --width 20 28 40 --height 20 28 40 \
+        --replications 100 --max-steps 1000 --output results.csv
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from shared.collector import ColumnarCollector
+from .model import MODEL_REPORTERS, RandomModel
+
+
+def run_model(params, max_steps=1000, interval=1):
+    """Run one configuration until max_steps, or until there is no dirt or no robot left.
+
+    Args:
+        params: Keyword arguments for RandomModel (width, height, seed).
+        max_steps: Maximum number of steps to run.
+        interval: Collect the metrics every this many steps.
+    Returns:
+        DataFrame with one row per collected step: the parameters, the step
+        number and the metrics of the collector.
+    """
+    model = RandomModel(**params, datacollector=ColumnarCollector(MODEL_REPORTERS, interval=interval))
+    while model.running and model.steps < max_steps:
+        model.step()
+        if not model.dirt_index or not model.robot_count:
+            break
+
+    results = model.datacollector.get_model_vars_dataframe().reset_index()
+    for column, value in reversed(params.items()):
+        results.insert(0, column, value)
+    return results
+
+
+def batch_run(widths=(28,), heights=(28,), seeds=range(10), max_steps=1000, interval=1, max_workers=None):
+    """Run every combination of the parameters in a process pool.
+
+    Args:
+        widths, heights, seeds: Values to sweep; all the
+            combinations are run.
+        max_steps: Maximum number of steps of every run.
+        interval: Collect the metrics every this many steps.
+        max_workers: Number of processes, all the cores by default.
+    Returns:
+        A single DataFrame with the rows of all the runs (see run_model).
+    """
+    configurations = [
+        {"width": w, "height": h, "seed": s}
+        for w, h, s in itertools.product(widths, heights, seeds)
+    ]
+    workers = max_workers or os.cpu_count() or 1
+    # Send the runs in chunks so thousands of short runs don't wait on the pool
+    chunksize = max(1, len(configurations) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(
+            run_model,
+            configurations,
+            itertools.repeat(max_steps),
+            itertools.repeat(interval),
+            chunksize=chunksize,
+        ))
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parameter sweep of the RandomModel.")
+    parser.add_argument("--width", type=int, nargs="+", default=[28], help="grid widths")
+    parser.add_argument("--height", type=int, nargs="+", default=[28], help="grid heights")
+    parser.add_argument("--seeds", type=int, nargs="+", default=None, help="seeds to run")
+    parser.add_argument("--replications", type=int, default=10,
+                        help="run seeds 0 to N-1 (ignored when --seeds is given)")
+    parser.add_argument("--max-steps", type=int, default=1000, help="step limit of every run")
+    parser.add_argument("--interval", type=int, default=1, help="collect the metrics every N steps")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    parser.add_argument("--output", default=None, help="CSV file for the results")
+    args = parser.parse_args(argv)
+
+    seeds = args.seeds if args.seeds is not None else range(args.replications)
+    results = batch_run(
+        widths=args.width,
+        heights=args.height,
+        seeds=seeds,
+        max_steps=args.max_steps,
+        interval=args.interval,
+        max_workers=args.workers,
+    )
+    if args.output:
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
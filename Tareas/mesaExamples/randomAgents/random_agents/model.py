@@ -1,8 +1,13 @@
+from collections import deque
+
+import numpy as np
 from mesa import Model
 from mesa.discrete_space import OrthogonalMooreGrid
 from mesa.datacollection import DataCollector
 
-from .agent import RandomAgent, ObstacleAgent, DirtAgent, BorderAgent, ChargingStationAgent
+from .agent import RandomAgent, ObstacleAgent, DirtAgent, BorderAgent, ChargingStationAgent, BLOCKED
+from shared import checkpoint
+from shared.profiler import Profiler
 
 class RandomModel(Model):
     """
@@ -10,36 +15,21 @@ class RandomModel(Model):
     Args:
         width, height: The size of the grid to model
         seed: Random seed
+        datacollector: Collector of the metrics. By default a Mesa
+            DataCollector with MODEL_REPORTERS; a ColumnarCollector
+            (shared/collector.py) keeps long runs in a fixed amount of memory.
+        profile: Time the phases of every step in self.profiler (see
+            shared/profiler.py). It can also be turned on later with
+            model.profiler.enabled = True.
     """
-    def __init__(self, width=28, height=28, seed=42):
+    def __init__(self, width=28, height=28, seed=42, datacollector=None, profile=False):
 
         super().__init__(seed=seed)
-        self.num_agents = 1
-        self.seed = seed
-        self.width = width
-        self.height = height
-
-        self.grid = OrthogonalMooreGrid([width, height], torus=False)
-        
-        # Identificar las coordenadas del borde de la grilla
-        border = [(x,y)
-                for y in range(height)
-                for x in range(width)
-                if y in [0, height-1] or x in [0, width - 1]]
-                
-
-        # Crear las celdas del borde
-        for _, cell in enumerate(self.grid):
-            if cell.coordinate in border:
-                obstacle = BorderAgent(self, cell=cell)
-                self.agents.add(obstacle)
+        cells, occupied = self._setup(width, height, seed, datacollector, profile)
 
         # Obtener la celda en coordenada (1,1)
-        start_cell = None
-        for cell in self.grid:
-            if cell.coordinate == (1, 1):
-                start_cell = cell
-                break
+        start_cell = self.grid[(1, 1)]
+        occupied[1, 1] = True
 
         # Crear estación de carga en (1,1)
         station = ChargingStationAgent(self, cell=start_cell)
@@ -61,63 +51,268 @@ class RandomModel(Model):
         DirtAgent.create_agents(
             self,
             dirt_count,
-            cell=self.random.choices(self.grid.empties.cells, k=dirt_count)
+            cell=self._random_empty_cells(occupied, cells, dirt_count)
         )
 
         # Crear obstáculos
+        obstacle_count = int(self.width * self.height * 0.1)
         ObstacleAgent.create_agents(
             self,
-            int(self.width * self.height * 0.1),
-            cell=self.random.choices(self.grid.empties.cells, k=int(self.width * self.height * 0.1))
+            obstacle_count,
+            cell=self._random_empty_cells(occupied, cells, obstacle_count)
         )
 
-        # Configurar DataCollector con funciones externas
-        self.datacollector = DataCollector(
-            model_reporters={
-                "Basura Recolectada": get_total_trash_collected,
-                "Energia": get_avg_energy,
-                "Porcentaje Limpio": get_percentage_clean_cells,
-                "Movimientos Totales": get_total_movements,
-            }
+        self.running = True
+
+    def _setup(self, width, height, seed, datacollector, profile=False):
+        """
+        Sets everything that doesn't use the random generators: the
+        attributes, the grid and its indices, the border and the collector.
+        Used by __init__ and load_checkpoint(). Returns the grid cells in
+        order and the occupancy array with the border marked.
+        """
+        self.num_agents = 1
+        self.seed = seed
+        self.width = width
+        self.height = height
+
+        # The grid uses the model's random generator so a seed gives the same run
+        self.grid = OrthogonalMooreGrid([width, height], torus=False, random=self.random)
+
+        # Índice de suciedad: celda -> DirtAgents en ella (lo mantiene DirtAgent)
+        self.dirt_index = {}
+
+        # Totales de los robots vivos, los mantiene RandomAgent
+        self.robot_count = 0
+        self.total_energy = 0
+        self.total_trash = 0
+        self.total_movements = 0
+
+        # Tipos de agentes fijos en cada celda, como bits (BORDER, OBSTACLE,
+        # DIRT, STATION de agent.py), y cuántos hay de cada tipo. Los mantienen
+        # los agentes al crearse y al quitarse. Los agentes de cada tipo están
+        # en self.agents_by_type, que mantiene Mesa.
+        self.cell_flags = {}
+        self._flag_counts = {}
+
+        # Rutas calculadas hacia cada destino, ver route_to()
+        self._routes = {}
+
+        # Celdas cambiadas desde el último take_changes(), None hasta la
+        # primera llamada (no se registra nada si nadie las pide)
+        self.changes = None
+
+        # Ocupación de la grilla: occupied[x, y] es True si la celda ya tiene
+        # algún agente. Aplanada sigue el orden de las celdas de la grilla
+        # (columna por columna), así que la posición i es la celda cells[i].
+        cells = list(self.grid)
+        occupied = np.zeros((width, height), dtype=bool)
+
+        # Crear las celdas del borde
+        occupied[[0, -1], :] = True
+        occupied[:, [0, -1]] = True
+        border = np.flatnonzero(occupied)
+        BorderAgent.create_agents(self, len(border), cell=[cells[i] for i in border])
+
+        # Configurar DataCollector con funciones externas, salvo que se
+        # pase otro recolector (por ejemplo un ColumnarCollector)
+        if datacollector is None:
+            datacollector = DataCollector(model_reporters=MODEL_REPORTERS)
+        self.datacollector = datacollector
+
+        # Tiempos de las fases de cada step, ver shared/profiler.py
+        self.profiler = Profiler(enabled=profile)
+
+        return cells, occupied
+
+    def _random_empty_cells(self, occupied, cells, k):
+        """
+        Picks k random empty cells (repetitions allowed, like random.choices)
+        and marks them as occupied. The empty cells come from the occupancy
+        array in the order of the grid, so the picks are the same as calling
+        random.choices on grid.empties, without going through every cell.
+        """
+        empties = np.flatnonzero(~occupied)
+        picks = self.random.choices(empties, k=k)
+        occupied.flat[picks] = True
+        return [cells[i] for i in picks]
+
+    def save_checkpoint(self, path):
+        """
+        Saves the state of the model to a .npz file (see shared/checkpoint.py):
+        the obstacles, the dirt left, the charging station, the robot
+        (cell, energy, counters, charging flag) and the random generators.
+        load_checkpoint() continues the run from this step exactly as this
+        model would. The data of the collector is not saved.
+        """
+        height = self.height
+
+        def numbers(cells):
+            return np.array([x * height + y for x, y in (cell.coordinate for cell in cells)], dtype=np.int64)
+
+        stations = list(self.agents_by_type.get(ChargingStationAgent, []))
+        station_number = {station: i for i, station in enumerate(stations)}
+        robots = list(self.agents_by_type.get(RandomAgent, []))
+        checkpoint.write(
+            path,
+            self,
+            {"width": self.width, "height": self.height, "seed": self.seed},
+            obstacles=numbers(agent.cell for agent in self.agents_by_type.get(ObstacleAgent, [])),
+            dirt=numbers(cell for cell, agents in self.dirt_index.items() for _ in agents),
+            stations=numbers(station.cell for station in stations),
+            robot_ids=np.array([robot.unique_id for robot in robots], dtype=np.int64),
+            robot_cells=numbers(robot.cell for robot in robots),
+            robot_stations=np.array([station_number.get(robot.charging_station, -1) for robot in robots],
+                                    dtype=np.int64),
+            energy=np.array([robot.energy for robot in robots], dtype=np.int64),
+            max_energy=np.array([robot.max_energy for robot in robots], dtype=np.int64),
+            trash_count=np.array([robot.trash_count for robot in robots], dtype=np.int64),
+            movement_count=np.array([robot.movement_count for robot in robots], dtype=np.int64),
+            is_charging=np.array([robot.is_charging for robot in robots], dtype=bool),
         )
 
-        self.running = True
+    @classmethod
+    def load_checkpoint(cls, path, datacollector=None):
+        """
+        Creates a model from a file written by save_checkpoint(). The
+        agents are placed from the file instead of drawing them, so it
+        only costs building the grid. It starts with a new collector.
+        """
+        header, arrays = checkpoint.read(path, cls)
+        model = cls.__new__(cls)
+        Model.__init__(model, seed=header["params"]["seed"])
+        cells, _ = model._setup(datacollector=datacollector, **header["params"])
+
+        stations = []
+        for i in arrays["stations"]:
+            station = ChargingStationAgent(model, cell=cells[i])
+            stations.append(station)
+
+        for i, unique_id in enumerate(arrays["robot_ids"]):
+            number = arrays["robot_stations"][i]
+            station = stations[number] if number >= 0 else None
+            robot = RandomAgent(
+                model,
+                energy=int(arrays["max_energy"][i]),
+                cell=cells[arrays["robot_cells"][i]],
+                charging_station=station,
+            )
+            robot.unique_id = int(unique_id)
+            robot.energy = int(arrays["energy"][i])
+            robot.trash_count = int(arrays["trash_count"][i])
+            robot.movement_count = int(arrays["movement_count"][i])
+            robot.is_charging = bool(arrays["is_charging"][i])
+            if station is not None:
+                station.assigned_robot = robot
+
+        DirtAgent.create_agents(model, len(arrays["dirt"]), cell=[cells[i] for i in arrays["dirt"]])
+        ObstacleAgent.create_agents(model, len(arrays["obstacles"]), cell=[cells[i] for i in arrays["obstacles"]])
+
+        checkpoint.restore(model, header, arrays)
+        return model
+
+    def take_changes(self):
+        """
+        Returns the coordinates of the cells whose agents changed since the
+        last call (robots that moved or died, dirt cleaned) and keeps
+        recording them. The first call returns None, since nothing was
+        recorded before it and the whole floor has to be drawn.
+        """
+        changes = self.changes
+        self.changes = set()
+        return changes
+
+    def mark_cell(self, cell, flag):
+        """Record that an agent of the kind `flag` is in the cell."""
+        key = (cell, flag)
+        self._flag_counts[key] = self._flag_counts.get(key, 0) + 1
+        self.cell_flags[cell] = self.cell_flags.get(cell, 0) | flag
+        if flag & BLOCKED:
+            self._routes.clear()
+
+    def unmark_cell(self, cell, flag):
+        """Undo mark_cell() for one agent. The bit is cleared with the last one."""
+        key = (cell, flag)
+        self._flag_counts[key] -= 1
+        if not self._flag_counts[key]:
+            del self._flag_counts[key]
+            flags = self.cell_flags[cell] & ~flag
+            if flags:
+                self.cell_flags[cell] = flags
+            else:
+                del self.cell_flags[cell]
+        if flag & BLOCKED:
+            self._routes.clear()
+
+    def route_to(self, target_cell):
+        """
+        Returns a dict from every cell that can reach target_cell to the
+        next cell of a shortest path towards it (None for the target).
+        It is a breadth-first search from the target over the cells
+        without obstacles or borders, done once per target and kept until
+        the obstacles change, so following the path is one lookup per step.
+        """
+        route = self._routes.get(target_cell)
+        if route is not None:
+            return route
+
+        cell_flags = self.cell_flags
+        route = {target_cell: None}
+        queue = deque([target_cell])
+        while queue:
+            cell = queue.popleft()
+            for neighbor in cell.neighborhood:
+                if neighbor not in route and not cell_flags.get(neighbor, 0) & BLOCKED:
+                    route[neighbor] = cell
+                    queue.append(neighbor)
+        self._routes[target_cell] = route
+        return route
 
     def step(self):
         '''Advance the model by one step.'''
-        self.agents.shuffle_do("step")
-        self.datacollector.collect(self)
+        profiler = self.profiler
+        with profiler.phase("step"):
+            # Solo los robots hacen algo en su step: los bordes, obstáculos,
+            # suciedad y estaciones quedan fuera del orden aleatorio
+            with profiler.phase("robots"):
+                robots = self.agents_by_type.get(RandomAgent)
+                if robots is not None:
+                    robots.shuffle_do("step")
+            with profiler.phase("collect"):
+                self.datacollector.collect(self)
 
 
 # Funciones para recolectar datos
+# Leen los totales que mantienen los agentes, sin recorrer model.agents
 def get_total_trash_collected(model):
     """Retorna la basura total recolectada por el robot"""
-    agents = [a for a in model.agents if isinstance(a, RandomAgent)]
-    if not agents:
-        return 0
-    return sum(agent.trash_count for agent in agents)
+    return model.total_trash
 
 
 def get_avg_energy(model):
     """Retorna la energía del robot"""
-    agents = [a for a in model.agents if isinstance(a, RandomAgent)]
-    if not agents:
+    if not model.robot_count:
         return 0
-    return agents[0].energy
+    return model.total_energy
 
 
 def get_percentage_clean_cells(model):
     """Calcula el porcentaje de celdas limpias (sin basura)"""
-    trash_agents = [a for a in model.agents if isinstance(a, DirtAgent)]
     total_cells = model.width * model.height
-    cells_with_trash = len(trash_agents)
+    cells_with_trash = len(model.dirt_index)
     clean_cells = total_cells - cells_with_trash
     return (clean_cells / total_cells) * 100
 
 
 def get_total_movements(model):
     """Suma todos los movimientos realizados por el robot"""
-    agents = [a for a in model.agents if isinstance(a, RandomAgent)]
-    if not agents:
-        return 0
-    return sum(agent.movement_count for agent in agents)
\ No newline at end of file
+    return model.total_movements
+
+
+# Métricas del modelo, por nombre de columna
+MODEL_REPORTERS = {
+    "Basura Recolectada": get_total_trash_collected,
+    "Energia": get_avg_energy,
+    "Porcentaje Limpio": get_percentage_clean_cells,
+    "Movimientos Totales": get_total_movements,
+}
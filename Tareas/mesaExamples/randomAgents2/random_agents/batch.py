@@ -0,0 +1,119 @@
+"""Run the RandomModel without the Solara page, for parameter sweeps.
+
+Every configuration runs in its own process, so a sweep of thousands of
+replications uses every core. Example, from the randomAgents2 folder:
+
+    python -m random_agents.batch --width 20 40 --height 20 40 \
+        --num-agents 1 5 10 --replications 100 --max-steps 1000 \
+        --output results.csv
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from shared.collector import ColumnarCollector
+from .model import MODEL_REPORTERS, ENGINES, RandomModel
+
+
+def run_model(params, max_steps=1000, interval=1):
+    """Run one configuration until max_steps, or until there is no dirt or no robot left.
+
+    Args:
+        params: Keyword arguments for RandomModel (num_agents, width, height,
+            seed, engine, headless).
+        max_steps: Maximum number of steps to run.
+        interval: Collect the metrics every this many steps.
+    Returns:
+        DataFrame with one row per collected step: the parameters, the step
+        number and the metrics of the collector.
+    """
+    model = RandomModel(**params, datacollector=ColumnarCollector(MODEL_REPORTERS, interval=interval))
+    if model.fleet is not None:
+        # Nothing draws the robots, don't move their agents in the grid
+        model.fleet.sync_agents = False
+    while model.running and model.steps < max_steps:
+        model.step()
+        if not model.dirty_cells or not model.robot_count:
+            break
+
+    results = model.datacollector.get_model_vars_dataframe().reset_index()
+    for column, value in reversed(params.items()):
+        results.insert(0, column, value)
+    return results
+
+
+def batch_run(widths=(8,), heights=(8,), num_agents=(10,), seeds=range(10), max_steps=1000,
+              interval=1, max_workers=None, engine="agents", headless=False):
+    """Run every combination of the parameters in a process pool.
+
+    Args:
+        widths, heights, num_agents, seeds: Values to sweep; all the
+            combinations are run.
+        max_steps: Maximum number of steps of every run.
+        interval: Collect the metrics every this many steps.
+        max_workers: Number of processes, all the cores by default.
+        engine: Engine of all the runs, "agents" or "numpy" (see RandomModel).
+        headless: Run the numpy engine without the grid and the agents,
+            much faster to build on large floors (see RandomModel).
+    Returns:
+        A single DataFrame with the rows of all the runs (see run_model).
+    """
+    configurations = [
+        {"num_agents": n, "width": w, "height": h, "seed": s, "engine": engine, "headless": headless}
+        for w, h, n, s in itertools.product(widths, heights, num_agents, seeds)
+    ]
+    workers = max_workers or os.cpu_count() or 1
+    # Send the runs in chunks so thousands of short runs don't wait on the pool
+    chunksize = max(1, len(configurations) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(
+            run_model,
+            configurations,
+            itertools.repeat(max_steps),
+            itertools.repeat(interval),
+            chunksize=chunksize,
+        ))
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parameter sweep of the RandomModel.")
+    parser.add_argument("--width", type=int, nargs="+", default=[8], help="grid widths")
+    parser.add_argument("--height", type=int, nargs="+", default=[8], help="grid heights")
+    parser.add_argument("--num-agents", type=int, nargs="+", default=[10], help="numbers of robots")
+    parser.add_argument("--seeds", type=int, nargs="+", default=None, help="seeds to run")
+    parser.add_argument("--replications", type=int, default=10,
+                        help="run seeds 0 to N-1 (ignored when --seeds is given)")
+    parser.add_argument("--max-steps", type=int, default=1000, help="step limit of every run")
+    parser.add_argument("--interval", type=int, default=1, help="collect the metrics every N steps")
+    parser.add_argument("--engine", choices=ENGINES, default="agents", help="engine of the runs")
+    parser.add_argument("--headless", action="store_true",
+                        help="run the numpy engine without the grid and the agents")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    parser.add_argument("--output", default=None, help="CSV file for the results")
+    args = parser.parse_args(argv)
+
+    seeds = args.seeds if args.seeds is not None else range(args.replications)
+    results = batch_run(
+        widths=args.width,
+        heights=args.height,
+        num_agents=args.num_agents,
+        seeds=seeds,
+        max_steps=args.max_steps,
+        interval=args.interval,
+        max_workers=args.workers,
+        engine=args.engine,
+        headless=args.headless,
+    )
+    if args.output:
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
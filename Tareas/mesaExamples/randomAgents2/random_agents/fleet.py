@@ -0,0 +1,336 @@
+import heapq
+
+import numpy as np
+
+from .agent import BLOCKED, DIRT
+
+# Same values as RandomAgent.move() and RandomAgent.charge()
+LOW_ENERGY = 30
+CHARGE_AMOUNT = 5
+
+
+class Fleet:
+    """State of all the robots in numpy arrays, stepped all at once.
+
+    A step gives the same result as calling step() on every robot in a
+    random order, like shuffle_do: every robot sees the cells as the robots
+    before it in the order left them. A robot only reads the cells around
+    it and only changes the cell it leaves and the one it enters, so two
+    robots more than 2 cells apart can't affect each other. Every round
+    resolves at once all the robots that have no earlier robot still
+    pending within 2 cells, which gives the same result as resolving them
+    one by one.
+
+    Cells are numbered x * height + y, the order of the grid cells. The
+    robots are RobotView agents that read their values from these arrays.
+    Moving the agents to their new cells of the grid is most of the cost of
+    a step, so it can be turned off with sync_agents (the Solara page
+    needs it, batch runs don't) and done later with sync().
+
+    A headless model (cells is None) has no grid and no agents at all: the
+    robots are only rows of the arrays and the dirt of every cell is
+    counted in `dirt`.
+
+    Args:
+        model: The RandomModel.
+        cells: The grid cells in the order of their number, None for a
+            headless model.
+        capacity: Expected number of robots, the arrays grow if needed.
+    """
+
+    def __init__(self, model, cells, capacity=0):
+        self.model = model
+        self.cells = cells
+        self.height = model.height
+        self.agents = []
+        self.sync_agents = cells is not None
+
+        # Kinds of fixed agent in every cell (bits of agent.py) and number
+        # of robots in it, kept up to date by the model and by step()
+        size = model.width * model.height
+        self.flags = np.zeros(size, dtype=np.uint8)
+        self.robots_here = np.zeros(size, dtype=np.int32)
+
+        # Dirt of every cell and number of dirty cells, only without a grid
+        # (the DirtAgents keep them otherwise)
+        self.dirt = np.zeros(size, dtype=np.int32) if cells is None else None
+        self.dirty_cells = 0
+
+        capacity = max(capacity, 1)
+        self.pos = np.zeros(capacity, dtype=np.int64)
+        self.station = np.full(capacity, -1, dtype=np.int64)
+        self.energy = np.zeros(capacity, dtype=np.int64)
+        self.max_energy = np.zeros(capacity, dtype=np.int64)
+        self.is_charging = np.zeros(capacity, dtype=bool)
+        self.trash = np.zeros(capacity, dtype=np.int64)
+        self.moves = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # Cell of every robot agent in the grid, see sync()
+        self._agent_pos = np.zeros(capacity, dtype=np.int64)
+
+        h = self.height
+        # Offsets of the 8 neighbors of a cell
+        self._offsets = np.array(
+            [dx * h + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy],
+            dtype=np.int64,
+        )
+        # Rank of the pending robots in a grid with one extra cell on every
+        # side, so the 5x5 block around any robot is inside it
+        self._ranks = np.full((model.width + 2) * (h + 2), np.iinfo(np.int64).max, dtype=np.int64)
+        self._near = np.array(
+            [dx * (h + 2) + dy for dx in range(-2, 3) for dy in range(-2, 3)],
+            dtype=np.int64,
+        )
+
+        # Cells left to walk to the charging station, last one first
+        self._paths = {}
+        self._blocked = None
+        self._eaten = []
+        self._died = []
+
+    @property
+    def size(self):
+        return len(self.agents)
+
+    def index(self, cell):
+        """Number of a grid cell."""
+        x, y = cell.coordinate
+        return x * self.height + y
+
+    def add(self, agent, cell, charging_station=None):
+        """Register a robot agent and return its index in the arrays."""
+        station = self.index(charging_station.cell) if charging_station is not None else -1
+        return self.add_robot(self.index(cell), station, agent)
+
+    def add_robot(self, pos, station=-1, agent=None):
+        """Register a robot in the cell number pos and return its index.
+        The robots of a headless model have no agent."""
+        i = len(self.agents)
+        if i == len(self.pos):
+            self._grow()
+        self.agents.append(agent)
+        self.pos[i] = self._agent_pos[i] = pos
+        self.station[i] = station
+        self.alive[i] = True
+        self.robots_here[pos] += 1
+        return i
+
+    def _grow(self):
+        for name in ("pos", "station", "energy", "max_energy", "is_charging", "trash", "moves", "alive",
+                     "_agent_pos"):
+            array = getattr(self, name)
+            grown = np.zeros(2 * len(array), dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+        self.station[len(self.agents):] = -1
+
+    def remove(self, i):
+        """Stop stepping robot i and take it out of its cell."""
+        if self.alive[i]:
+            self.alive[i] = False
+            self.robots_here[self.pos[i]] -= 1
+        self._paths.pop(i, None)
+
+    def set_flags(self, cell, flags):
+        """Record the kinds of fixed agent in a cell (see RandomModel.mark_cell)."""
+        i = self.index(cell)
+        if (int(self.flags[i]) ^ flags) & BLOCKED:
+            self._blocked = None
+            self._paths.clear()
+        self.flags[i] = flags
+
+    def step(self):
+        """Advance every robot one step, in a random order. The parts are
+        the "charge", "move" and "finish" phases of the model's profiler."""
+        profiler = self.model.profiler
+        n = self.size
+        order = self.model.rng.permutation(np.flatnonzero(self.alive[:n]))
+        energy = self.energy
+
+        with profiler.phase("charge"):
+            # Charging robots only charge, until they are full
+            charging = self.is_charging[order]
+            charge = order[charging]
+            energy[charge] = np.minimum(energy[charge] + CHARGE_AMOUNT, self.max_energy[charge])
+            self.is_charging[charge] = energy[charge] < self.max_energy[charge]
+
+            # Low robots at their station start charging, the rest move
+            active = order[~charging]
+            low = (energy[active] <= LOW_ENERGY) & (self.station[active] >= 0)
+            docked = low & (self.pos[active] == self.station[active])
+            self.is_charging[active] = docked
+            energy[active] -= 1
+            for i in active[docked]:
+                self._paths.pop(i, None)
+                if energy[i] <= 0:
+                    self.remove(i)
+                    self._died.append(i)
+                    self._record([self.pos[i]])
+
+        with profiler.phase("move"):
+            self._resolve(active[~docked], low[~docked])
+        with profiler.phase("finish"):
+            self._finish()
+
+    def _resolve(self, movers, home):
+        """Move the robots in `movers` (in order), in rounds of independent robots."""
+        draws = self.model.rng.random(len(movers))
+        h = self.height
+        x, y = np.divmod(self.pos[movers], h)
+        padded = (x + 1) * (h + 2) + y + 1
+        ranks = self._ranks
+        empty = ranks[0]
+
+        pending = np.arange(len(movers))
+        while pending.size:
+            cells = padded[pending]
+            np.minimum.at(ranks, cells, pending)
+            nearest = ranks[cells[None, :] + self._near[:, None]].min(axis=0)
+            ranks[cells] = empty
+            ready = nearest == pending
+            chosen = pending[ready]
+            self._move(movers[chosen], home[chosen], draws[chosen])
+            pending = pending[~ready]
+
+    def _move(self, robots, home, draws):
+        """Move robots that are more than 2 cells apart from each other."""
+        pos = self.pos[robots]
+        new = pos.copy()
+
+        # Low robots walk to their station, or stay if there's no way there
+        for i in np.flatnonzero(home):
+            robot = robots[i]
+            path = self._paths.get(robot)
+            if path is None:
+                path = self._paths[robot] = self._shortest_path(pos[i], self.station[robot])
+            if path:
+                new[i] = path.pop()
+        self.moves[robots[home]] += 1
+
+        # The others go to a neighbor with dirt, or else to an empty one
+        wander = ~home
+        if wander.any():
+            neighbors = pos[wander, None] + self._offsets
+            flags = self.flags[neighbors]
+            dirty = (flags & DIRT) != 0
+            free = (flags == 0) & (self.robots_here[neighbors] == 0)
+            options = np.where(dirty.any(axis=1)[:, None], dirty, free)
+            counts = options.sum(axis=1)
+            pick = (draws[wander] * counts).astype(np.int64)
+            column = np.argmax(options.cumsum(axis=1) > pick[:, None], axis=1)
+            moved = counts > 0
+            new[wander] = np.where(moved, neighbors[np.arange(len(column)), column], pos[wander])
+            self.moves[robots[wander]] += moved
+
+        self.robots_here[pos] -= 1
+        self.pos[robots] = new
+        dead = self.energy[robots] <= 0
+        changed = (new != pos) | dead
+        self._record(np.concatenate([pos[changed], new[changed]]))
+        self.robots_here[new[~dead]] += 1
+        self.alive[robots[dead]] = False
+        for robot in robots[dead]:
+            self._paths.pop(robot, None)
+        self._died.extend(robots[dead].tolist())
+
+        # Eat the dirt of the new cells; the agents are cleaned in _finish()
+        eats = (self.flags[new] & DIRT) != 0
+        self.flags[new[eats]] &= np.uint8(0xFF ^ DIRT)
+        self._eaten.extend(zip(robots[eats].tolist(), new[eats].tolist()))
+
+    def _finish(self):
+        """Update the dirt, the robot agents and the model's totals after a step."""
+        if self.dirt is not None:
+            for robot, i in self._eaten:
+                self.trash[robot] += self.dirt[i]
+                self.dirt[i] = 0
+            self.dirty_cells -= len(self._eaten)
+        else:
+            dirt_index = self.model.dirt_index
+            for robot, i in self._eaten:
+                dirt = dirt_index.get(self.cells[i], ())
+                self.trash[robot] += len(dirt)
+                for agent in list(dirt):
+                    agent.clean()
+        self._eaten.clear()
+
+        for robot in self._died:
+            agent = self.agents[robot]
+            if agent is not None:
+                agent.remove()
+            else:
+                self.model.robot_count -= 1
+        self._died.clear()
+        if self.sync_agents:
+            with self.model.profiler.phase("sync"):
+                self.sync()
+        self.update_totals()
+
+    def update_totals(self):
+        """Set the model's totals from the arrays of the robots alive."""
+        n = self.size
+        alive = self.alive[:n]
+        model = self.model
+        model.total_energy = int(self.energy[:n][alive].sum())
+        model.total_trash = int(self.trash[:n][alive].sum())
+        model.total_movements = int(self.moves[:n][alive].sum())
+
+    def _record(self, cells):
+        """Add the cells (flat indices) to the model's changes, if it records them."""
+        changes = self.model.changes
+        if changes is not None:
+            h = self.height
+            changes.update(divmod(int(i), h) for i in cells)
+
+    def sync(self):
+        """Move the robot agents to the cells where the arrays have them."""
+        if self.cells is None:
+            return
+        n = self.size
+        moved = np.flatnonzero(self.alive[:n] & (self.pos[:n] != self._agent_pos[:n]))
+        for robot in moved:
+            self.agents[robot].cell = self.cells[self.pos[robot]]
+        self._agent_pos[moved] = self.pos[moved]
+
+    def _shortest_path(self, start, goal):
+        """
+        Returns the cells of a shortest path from start to goal around
+        obstacles and borders, goal first and without start, so pop()
+        gives the next cell. Empty if goal can't be reached.
+        A* search with the number of king moves as the estimate, which
+        only looks at the cells between the robot and its station instead
+        of the whole floor like RandomModel.route_to().
+        """
+        if self._blocked is None:
+            self._blocked = ((self.flags & BLOCKED) != 0).tolist()
+        blocked = self._blocked
+        offsets = self._offsets.tolist()
+        h = self.height
+        start, goal = int(start), int(goal)
+        gx, gy = divmod(goal, h)
+
+        came_from = {start: None}
+        cost = {start: 0}
+        queue = [(0, start)]
+        while queue:
+            _, cell = heapq.heappop(queue)
+            if cell == goal:
+                break
+            g = cost[cell] + 1
+            for offset in offsets:
+                neighbor = cell + offset
+                if blocked[neighbor] or cost.get(neighbor, g + 1) <= g:
+                    continue
+                cost[neighbor] = g
+                came_from[neighbor] = cell
+                x, y = divmod(neighbor, h)
+                heapq.heappush(queue, (g + max(abs(x - gx), abs(y - gy)), neighbor))
+        else:
+            return []
+
+        path = []
+        cell = goal
+        while cell != start:
+            path.append(cell)
+            cell = came_from[cell]
+        return path
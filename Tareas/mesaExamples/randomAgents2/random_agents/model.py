@@ -1,8 +1,17 @@
+from collections import deque
+
+import numpy as np
 from mesa import Model
 from mesa.discrete_space import OrthogonalMooreGrid
 from mesa.datacollection import DataCollector
 
-from .agent import RandomAgent, ObstacleAgent, DirtAgent, BorderAgent, ChargingStationAgent
+from .agent import (RandomAgent, RobotView, ObstacleAgent, DirtAgent, BorderAgent, ChargingStationAgent, BLOCKED,
+                    BORDER, DIRT, OBSTACLE, STATION)
+from .fleet import Fleet
+from shared import checkpoint
+from shared.profiler import Profiler
+
+ENGINES = ("agents", "numpy")
 
 class RandomModel(Model):
     """
@@ -10,42 +19,55 @@ class RandomModel(Model):
     Args:
         num_agents: Number of agents in the simulation
         height, width: The size of the grid to model
+        engine: "agents" steps every agent one by one. "numpy" keeps the
+            robots in the arrays of a Fleet (see fleet.py) and moves them
+            all at once, with the same rules and a random order each step.
+            It draws its random numbers from self.rng, so the same seed
+            gives the same run, but not the run of the agents engine.
+        datacollector: Collector of the metrics. By default a Mesa
+            DataCollector with MODEL_REPORTERS; a ColumnarCollector
+            (shared/collector.py) keeps long runs in a fixed amount of memory.
+        profile: Time the phases of every step in self.profiler (see
+            shared/profiler.py). It can also be turned on later with
+            model.profiler.enabled = True.
+        headless: Only for the numpy engine. Don't build the grid nor any
+            agent: the robots, dirt, obstacles and stations only exist in
+            the arrays of the fleet, so a 1000x1000 floor is built in a
+            fraction of a second instead of the over 20 s of Mesa's grid. The
+            run is the same as without headless, but it can't be drawn.
     """
-    def __init__(self, num_agents=10, width=8, height=8, seed=42):
+    def __init__(self, num_agents=10, width=8, height=8, seed=42, engine="agents", datacollector=None,
+                 profile=False, headless=False):
 
         super().__init__(seed=seed)
-        self.num_agents = num_agents
-        self.seed = seed
-        self.width = width
-        self.height = height
+        cells, occupied = self._setup(num_agents, width, height, seed, engine, datacollector, profile, headless)
+        robot_class = RobotView if self.fleet is not None else RandomAgent
 
-        self.grid = OrthogonalMooreGrid([width, height], torus=False)
-        
-        # Identificar las coordenadas del borde de la grilla
-        border = [(x,y)
-                for y in range(height)
-                for x in range(width)
-                if y in [0, height-1] or x in [0, width - 1]]
-                
+        # Celdas de las estaciones de carga (una por robot), la suciedad y
+        # los obstáculos, sorteadas en ese orden
+        dirt_count = int(self.width * self.height * 0.1)
+        obstacle_count = int(self.width * self.height * 0.1)
+        station_picks = self._random_empty(occupied, self.num_agents)
+        dirt_picks = self._random_empty(occupied, dirt_count)
+        obstacle_picks = self._random_empty(occupied, obstacle_count)
 
-        # Crear las celdas del borde
-        for _, cell in enumerate(self.grid):
-            if cell.coordinate in border:
-                obstacle = BorderAgent(self, cell=cell)
-                self.agents.add(obstacle)
+        if self.grid is None:
+            self._fill_fleet(station_picks, station_picks, np.arange(self.num_agents), dirt_picks,
+                             obstacle_picks, energy=100)
+            self.running = True
+            return
 
         # Crear estaciones de carga PRIMERO (una por robot)
-        charging_cells = self.random.choices(self.grid.empties.cells, k=self.num_agents)
         charging_stations = []
         
-        for cell in charging_cells:
+        for cell in (cells[i] for i in station_picks):
             station = ChargingStationAgent(self, cell=cell)
             self.agents.add(station)
             charging_stations.append(station)
 
         # Crear robots EN LA MISMA POSICIÓN que sus estaciones de carga
         for i in range(self.num_agents):
-            robot = RandomAgent(
+            robot = robot_class(
                 self, 
                 energy=100,
                 cell=charging_stations[i].cell,
@@ -56,67 +78,384 @@ class RandomModel(Model):
             charging_stations[i].assigned_robot = robot
 
         # Crear suciedad
-        dirt_count = int(self.width * self.height * 0.1)
         DirtAgent.create_agents(
             self,
             dirt_count,
-            cell=self.random.choices(self.grid.empties.cells, k=dirt_count)
+            cell=[cells[i] for i in dirt_picks]
         )
 
         # Crear obstáculos
         ObstacleAgent.create_agents(
             self,
-            int(self.width * self.height * 0.1),
-            cell=self.random.choices(self.grid.empties.cells, k=int(self.width * self.height * 0.1))
+            obstacle_count,
+            cell=[cells[i] for i in obstacle_picks]
         )
 
-        # Configurar DataCollector con funciones externas
-        self.datacollector = DataCollector(
-            model_reporters={
-                "Basura Recolectada": get_total_trash_collected,
-                "Energia promedio": get_avg_energy,
-                "Porcentaje Limpio": get_percentage_clean_cells,
-                "Movimientos Totales": get_total_movements,
-            }
+        self.running = True
+
+    def _setup(self, num_agents, width, height, seed, engine, datacollector, profile=False, headless=False):
+        """
+        Sets everything that doesn't use the random generators: the
+        attributes, the grid and its indices, the border and the collector.
+        Used by __init__ and load_checkpoint(). Returns the grid cells in
+        order (None when headless) and the occupancy array with the border
+        marked.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+        if headless and engine != "numpy":
+            raise ValueError("Only the numpy engine can run headless, the agents engine needs the grid")
+        self.engine = engine
+        self.num_agents = num_agents
+        self.seed = seed
+        self.width = width
+        self.height = height
+
+        # The grid uses the model's random generator so a seed gives the same run
+        self.grid = None if headless else OrthogonalMooreGrid([width, height], torus=False, random=self.random)
+
+        # Índice de suciedad: celda -> DirtAgents en ella (lo mantiene DirtAgent)
+        self.dirt_index = {}
+
+        # Totales de los robots vivos, los mantiene RandomAgent
+        self.robot_count = 0
+        self.total_energy = 0
+        self.total_trash = 0
+        self.total_movements = 0
+
+        # Tipos de agentes fijos en cada celda, como bits (BORDER, OBSTACLE,
+        # DIRT, STATION de agent.py), y cuántos hay de cada tipo. Los mantienen
+        # los agentes al crearse y al quitarse. Los agentes de cada tipo están
+        # en self.agents_by_type, que mantiene Mesa.
+        self.cell_flags = {}
+        self._flag_counts = {}
+
+        # Rutas calculadas hacia cada destino, ver route_to()
+        self._routes = {}
+
+        # Celdas cambiadas desde el último take_changes(), None hasta la
+        # primera llamada (no se registra nada si nadie las pide)
+        self.changes = None
+
+        # Ocupación de la grilla: occupied[x, y] es True si la celda ya tiene
+        # algún agente. Aplanada sigue el orden de las celdas de la grilla
+        # (columna por columna), así que la posición i es la celda cells[i].
+        cells = list(self.grid) if self.grid is not None else None
+        occupied = np.zeros((width, height), dtype=bool)
+
+        # Robots of the numpy engine, it has to exist before any agent so
+        # it gets the flags of every cell
+        self.fleet = Fleet(self, cells, num_agents) if engine == "numpy" else None
+
+        # Crear las celdas del borde
+        occupied[[0, -1], :] = True
+        occupied[:, [0, -1]] = True
+        border = np.flatnonzero(occupied)
+        if self.grid is None:
+            self.fleet.flags[border] |= BORDER
+        else:
+            BorderAgent.create_agents(self, len(border), cell=[cells[i] for i in border])
+
+        # Configurar DataCollector con funciones externas, salvo que se
+        # pase otro recolector (por ejemplo un ColumnarCollector)
+        if datacollector is None:
+            datacollector = DataCollector(model_reporters=MODEL_REPORTERS)
+        self.datacollector = datacollector
+
+        # Tiempos de las fases de cada step, ver shared/profiler.py
+        self.profiler = Profiler(enabled=profile)
+
+        return cells, occupied
+
+    def _random_empty(self, occupied, k):
+        """
+        Picks k random empty cells (repetitions allowed, like random.choices)
+        and marks them as occupied. Returns their numbers, the positions in
+        the list of grid cells. The empty cells come from the occupancy
+        array in the order of the grid, so the picks are the same as calling
+        random.choices on grid.empties, without going through every cell.
+        """
+        empties = np.flatnonzero(~occupied)
+        picks = np.array(self.random.choices(empties, k=k), dtype=np.int64)
+        occupied.flat[picks] = True
+        return picks
+
+    def _fill_fleet(self, stations, robot_cells, robot_stations, dirt, obstacles, energy):
+        """
+        Places everything of a headless model in the arrays of the fleet,
+        by cell number: the robots (in robot_cells, each one with the
+        station stations[robot_stations[i]], or none if it's -1), the dirt
+        (a cell can appear more than once) and the obstacles.
+        """
+        fleet = self.fleet
+        for cell, number in zip(robot_cells.tolist(), robot_stations.tolist()):
+            fleet.add_robot(cell, int(stations[number]) if number >= 0 else -1)
+        n = fleet.size
+        fleet.energy[:n] = energy
+        fleet.max_energy[:n] = energy
+        fleet.flags[stations] |= STATION
+        fleet.flags[obstacles] |= OBSTACLE
+        fleet.flags[dirt] |= DIRT
+        np.add.at(fleet.dirt, dirt, 1)
+        fleet.dirty_cells = int(np.count_nonzero(fleet.dirt))
+        self.robot_count = n
+        fleet.update_totals()
+
+    @property
+    def dirty_cells(self):
+        """Number of cells with dirt."""
+        if self.grid is None:
+            return self.fleet.dirty_cells
+        return len(self.dirt_index)
+
+    def save_checkpoint(self, path):
+        """
+        Saves the state of the model to a .npz file (see shared/checkpoint.py):
+        the obstacles, the dirt left, the charging stations, every robot
+        (cell, energy, counters, charging flag and station), the paths of
+        the fleet and the random generators. load_checkpoint() continues
+        the run from this step exactly as this model would.
+        The data of the collector is not saved.
+        """
+        params = {"num_agents": self.num_agents, "width": self.width, "height": self.height,
+                  "seed": self.seed, "engine": self.engine, "headless": self.grid is None}
+        if self.grid is None:
+            # Every robot of a headless model has its own station, in its order
+            fleet = self.fleet
+            n = fleet.size
+            checkpoint.write(
+                path,
+                self,
+                params,
+                obstacles=np.flatnonzero(fleet.flags & OBSTACLE),
+                dirt=np.repeat(np.arange(len(fleet.dirt)), fleet.dirt),
+                stations=fleet.station[:n].copy(),
+                robot_ids=np.arange(n, dtype=np.int64),
+                robot_cells=fleet.pos[:n].copy(),
+                robot_alive=fleet.alive[:n].copy(),
+                robot_stations=np.arange(n, dtype=np.int64),
+                energy=fleet.energy[:n].copy(),
+                max_energy=fleet.max_energy[:n].copy(),
+                trash_count=fleet.trash[:n].copy(),
+                movement_count=fleet.moves[:n].copy(),
+                is_charging=fleet.is_charging[:n].copy(),
+                path_robots=np.array(list(fleet._paths), dtype=np.int64),
+                path_lengths=np.array([len(cells) for cells in fleet._paths.values()], dtype=np.int64),
+                path_cells=np.array([cell for cells in fleet._paths.values() for cell in cells], dtype=np.int64),
+            )
+            return
+
+        height = self.height
+
+        def numbers(cells):
+            return np.array([x * height + y for x, y in (cell.coordinate for cell in cells)], dtype=np.int64)
+
+        stations = list(self.agents_by_type.get(ChargingStationAgent, []))
+        station_number = {station: i for i, station in enumerate(stations)}
+        if self.fleet is not None:
+            # The fleet keeps the slots of the dead robots, which change
+            # the random order, so they are saved too
+            robots = self.fleet.agents
+            robot_cells = self.fleet.pos[:len(robots)]
+            alive = self.fleet.alive[:len(robots)]
+        else:
+            robots = list(self.agents_by_type.get(RandomAgent, []))
+            robot_cells = numbers(robot.cell for robot in robots)
+            alive = np.ones(len(robots), dtype=bool)
+
+        paths = self.fleet._paths if self.fleet is not None else {}
+        checkpoint.write(
+            path,
+            self,
+            params,
+            obstacles=numbers(agent.cell for agent in self.agents_by_type.get(ObstacleAgent, [])),
+            dirt=numbers(cell for cell, agents in self.dirt_index.items() for _ in agents),
+            stations=numbers(station.cell for station in stations),
+            robot_ids=np.array([robot.unique_id for robot in robots], dtype=np.int64),
+            robot_cells=np.asarray(robot_cells, dtype=np.int64),
+            robot_alive=np.asarray(alive, dtype=bool),
+            robot_stations=np.array([station_number.get(robot.charging_station, -1) for robot in robots],
+                                    dtype=np.int64),
+            energy=np.array([robot.energy for robot in robots], dtype=np.int64),
+            max_energy=np.array([robot.max_energy for robot in robots], dtype=np.int64),
+            trash_count=np.array([robot.trash_count for robot in robots], dtype=np.int64),
+            movement_count=np.array([robot.movement_count for robot in robots], dtype=np.int64),
+            is_charging=np.array([robot.is_charging for robot in robots], dtype=bool),
+            path_robots=np.array(list(paths), dtype=np.int64),
+            path_lengths=np.array([len(cells) for cells in paths.values()], dtype=np.int64),
+            path_cells=np.array([cell for cells in paths.values() for cell in cells], dtype=np.int64),
         )
 
-        self.running = True
+    @classmethod
+    def load_checkpoint(cls, path, datacollector=None):
+        """
+        Creates a model from a file written by save_checkpoint(). The
+        agents are placed from the file instead of drawing them, so it
+        only costs building the grid. It starts with a new collector.
+        """
+        header, arrays = checkpoint.read(path, cls)
+        model = cls.__new__(cls)
+        Model.__init__(model, seed=header["params"]["seed"])
+        cells, _ = model._setup(datacollector=datacollector, **header["params"])
+        robot_class = RobotView if model.fleet is not None else RandomAgent
+
+        if model.grid is None:
+            fleet = model.fleet
+            model._fill_fleet(arrays["stations"], arrays["robot_cells"], arrays["robot_stations"],
+                              arrays["dirt"], arrays["obstacles"], energy=arrays["max_energy"])
+            fleet.energy[:fleet.size] = arrays["energy"]
+            fleet.trash[:fleet.size] = arrays["trash_count"]
+            fleet.moves[:fleet.size] = arrays["movement_count"]
+            fleet.is_charging[:fleet.size] = arrays["is_charging"]
+            for i in np.flatnonzero(~arrays["robot_alive"]):
+                fleet.remove(i)
+                model.robot_count -= 1
+            fleet.update_totals()
+        else:
+            stations = []
+            for i in arrays["stations"]:
+                station = ChargingStationAgent(model, cell=cells[i])
+                stations.append(station)
+
+            for i, unique_id in enumerate(arrays["robot_ids"]):
+                number = arrays["robot_stations"][i]
+                station = stations[number] if number >= 0 else None
+                robot = robot_class(
+                    model,
+                    energy=int(arrays["max_energy"][i]),
+                    cell=cells[arrays["robot_cells"][i]],
+                    charging_station=station,
+                )
+                robot.unique_id = int(unique_id)
+                robot.energy = int(arrays["energy"][i])
+                robot.trash_count = int(arrays["trash_count"][i])
+                robot.movement_count = int(arrays["movement_count"][i])
+                robot.is_charging = bool(arrays["is_charging"][i])
+                if station is not None:
+                    station.assigned_robot = robot
+                if not arrays["robot_alive"][i]:
+                    robot.remove()
+
+            DirtAgent.create_agents(model, len(arrays["dirt"]), cell=[cells[i] for i in arrays["dirt"]])
+            ObstacleAgent.create_agents(model, len(arrays["obstacles"]), cell=[cells[i] for i in arrays["obstacles"]])
+
+        if model.fleet is not None:
+            ends = np.cumsum(arrays["path_lengths"])
+            for robot, end, length in zip(arrays["path_robots"], ends, arrays["path_lengths"]):
+                model.fleet._paths[int(robot)] = arrays["path_cells"][end - length:end].tolist()
+
+        checkpoint.restore(model, header, arrays)
+        return model
+
+    def take_changes(self):
+        """
+        Returns the coordinates of the cells whose agents changed since the
+        last call (robots that moved or died, dirt cleaned) and keeps
+        recording them. The first call returns None, since nothing was
+        recorded before it and the whole floor has to be drawn.
+        """
+        changes = self.changes
+        self.changes = set()
+        return changes
+
+    def mark_cell(self, cell, flag):
+        """Record that an agent of the kind `flag` is in the cell."""
+        key = (cell, flag)
+        self._flag_counts[key] = self._flag_counts.get(key, 0) + 1
+        self.cell_flags[cell] = self.cell_flags.get(cell, 0) | flag
+        if flag & BLOCKED:
+            self._routes.clear()
+        if self.fleet is not None:
+            self.fleet.set_flags(cell, self.cell_flags.get(cell, 0))
+
+    def unmark_cell(self, cell, flag):
+        """Undo mark_cell() for one agent. The bit is cleared with the last one."""
+        key = (cell, flag)
+        self._flag_counts[key] -= 1
+        if not self._flag_counts[key]:
+            del self._flag_counts[key]
+            flags = self.cell_flags[cell] & ~flag
+            if flags:
+                self.cell_flags[cell] = flags
+            else:
+                del self.cell_flags[cell]
+        if flag & BLOCKED:
+            self._routes.clear()
+        if self.fleet is not None:
+            self.fleet.set_flags(cell, self.cell_flags.get(cell, 0))
+
+    def route_to(self, target_cell):
+        """
+        Returns a dict from every cell that can reach target_cell to the
+        next cell of a shortest path towards it (None for the target).
+        It is a breadth-first search from the target over the cells
+        without obstacles or borders, done once per target and kept until
+        the obstacles change, so following the path is one lookup per step.
+        """
+        route = self._routes.get(target_cell)
+        if route is not None:
+            return route
+
+        cell_flags = self.cell_flags
+        route = {target_cell: None}
+        queue = deque([target_cell])
+        while queue:
+            cell = queue.popleft()
+            for neighbor in cell.neighborhood:
+                if neighbor not in route and not cell_flags.get(neighbor, 0) & BLOCKED:
+                    route[neighbor] = cell
+                    queue.append(neighbor)
+        self._routes[target_cell] = route
+        return route
 
     def step(self):
         '''Advance the model by one step.'''
-        self.agents.shuffle_do("step")
-        self.datacollector.collect(self)
+        profiler = self.profiler
+        with profiler.phase("step"):
+            with profiler.phase("robots"):
+                if self.fleet is not None:
+                    self.fleet.step()
+                else:
+                    # Solo los robots hacen algo en su step: los bordes, obstáculos,
+                    # suciedad y estaciones quedan fuera del orden aleatorio
+                    robots = self.agents_by_type.get(RandomAgent)
+                    if robots is not None:
+                        robots.shuffle_do("step")
+            with profiler.phase("collect"):
+                self.datacollector.collect(self)
 
 
 # Funciones para recolectar datos
+# Leen los totales que mantienen los agentes, sin recorrer model.agents
 def get_total_trash_collected(model):
     """Retorna la basura total recolectada por todos los robots"""
-    agents = [a for a in model.agents if isinstance(a, RandomAgent)]
-    if not agents:
-        return 0
-    return sum(agent.trash_count for agent in agents)
+    return model.total_trash
 
 
 def get_avg_energy(model):
     """Calcula el promedio de energía de los robots"""
-    agents = [a for a in model.agents if isinstance(a, RandomAgent)]
-    if not agents:
+    if not model.robot_count:
         return 0
-    return sum(agent.energy for agent in agents) / len(agents)
+    return model.total_energy / model.robot_count
 
 
 def get_percentage_clean_cells(model):
     """Calcula el porcentaje de celdas limpias (sin basura)"""
-    trash_agents = [a for a in model.agents if isinstance(a, DirtAgent)]
     total_cells = model.width * model.height
-    cells_with_trash = len(trash_agents)
+    cells_with_trash = model.dirty_cells
     clean_cells = total_cells - cells_with_trash
     return (clean_cells / total_cells) * 100
 
 
 def get_total_movements(model):
     """Suma todos los movimientos realizados por todos los agentes"""
-    agents = [a for a in model.agents if isinstance(a, RandomAgent)]
-    if not agents:
-        return 0
-    return sum(agent.movement_count for agent in agents)
\ No newline at end of file
+    return model.total_movements
+
+
+# Métricas del modelo, por nombre de columna
+MODEL_REPORTERS = {
+    "Basura Recolectada": get_total_trash_collected,
+    "Energia promedio": get_avg_energy,
+    "Porcentaje Limpio": get_percentage_clean_cells,
+    "Movimientos Totales": get_total_movements,
+}
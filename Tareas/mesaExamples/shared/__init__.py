@@ -0,0 +1,19 @@
+"""Helpers used by more than one of the example models.
+
+The examples are run from their own folder (solara run app.py), so each
+package adds this folder's parent to sys.path in its __init__.py and the
+helpers are imported as shared.<module>.
+
+Models:
+    boards: Random initial boards of the cellular automata.
+    checkpoint: Save and load the state of a model.
+    collector: Columnar data collector for long runs of the Roomba models.
+    hashlife: HashLife engine of the row-by-row cellular automata.
+    parallel: Multi-process engine of the cellular automata.
+    profiler: Time the phases of the steps.
+
+Solara pages:
+    canvas: Canvas that only receives the cells that changed.
+    raster: The board of a cellular automaton as a PNG image.
+    runner: Fast-forward control, runs many steps in a thread.
+"""
@@ -0,0 +1,41 @@
+"""Random initial boards of the cellular automata.
+
+The Cell agents draw their initial states with model.random, one
+random() per cell in the order of grid.all_cells (column by column), and
+the array engines draw the same numbers so every engine starts from the
+same board for the same seed. Drawing them one by one through a list of
+floats takes 8 bytes plus a Python float per cell, gigabytes for the
+largest boards. random_board() copies the Mersenne Twister state of
+model.random to a numpy RandomState, which produces exactly the same
+numbers, draws them a few columns at a time straight into a uint8 board
+and copies the state back, so model.random goes on as if it had drawn
+every number itself.
+"""
+import numpy as np
+
+# Random numbers drawn at once (8 bytes each)
+CHUNK = 1 << 20
+
+
+def random_board(random, width, height, fraction, out=None):
+    """Return a (height, width) uint8 board whose cells are alive with a probability of fraction.
+
+    Args:
+        random: The random.Random of the model, advanced by width * height
+            numbers.
+        out: Array to fill instead of a new one, like the shared memory of
+            the parallel engine.
+    """
+    if out is None:
+        out = np.empty((height, width), dtype=np.uint8)
+    version, internal, gauss_next = random.getstate()
+    generator = np.random.RandomState()
+    generator.set_state(("MT19937", np.array(internal[:-1], dtype=np.uint32), internal[-1]))
+    columns = max(1, CHUNK // max(1, height))
+    for start in range(0, width, columns):
+        stop = min(width, start + columns)
+        draws = generator.random_sample((stop - start, height))
+        out[:, start:stop] = (draws < fraction).T
+    _, key, position = generator.get_state()[:3]
+    random.setstate((version, tuple(int(k) for k in key) + (int(position),), gauss_next))
+    return out
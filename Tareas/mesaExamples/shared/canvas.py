@@ -0,0 +1,140 @@
+"""Drawing of a grid that only sends the cells that changed.
+
+The other views build the whole picture again in every frame, so the data
+sent to the browser and the time to draw it grow with the size of the
+grid. DeltaView keeps a <canvas> in the browser with one pixel per cell
+and, after the first frame, only sends the cells that changed since the
+last one (model.take_changes()), so they grow with the activity of the
+model instead. The whole grid (a keyframe) is sent again for a new model,
+every KEYFRAME_EVERY frames, in case a frame was lost, and when so many
+cells changed that it is cheaper than the list of cells.
+
+Every cell is drawn with a color of a palette: the page gives a function
+that returns the palette index of every cell as a (height, width) array,
+for the keyframes, and one that returns the index of a single cell.
+"""
+import base64
+
+import ipyvue
+import numpy as np
+import solara
+import traitlets
+from mesa.visualization.utils import update_counter
+
+from shared.runner import step_lock
+
+# Frames between two keyframes
+KEYFRAME_EVERY = 50
+# Share of the cells above which a keyframe is sent instead of the changes:
+# a keyframe takes about 1.3 bytes per cell and a changed cell about 12
+KEYFRAME_SHARE = 0.1
+
+TEMPLATE = """
+<template>
+  <canvas ref="canvas" :style="'width: ' + size + 'px; image-rendering: pixelated; border: 1px solid #ccc'"></canvas>
+</template>
+<script>
+module.exports = {
+  mounted() {
+    this.paint(this.frame);
+  },
+  watch: {
+    frame(frame) {
+      this.paint(frame);
+    },
+  },
+  methods: {
+    paint(frame) {
+      if (!frame || !this.palette.length) {
+        return;
+      }
+      const canvas = this.$refs.canvas;
+      const context = canvas.getContext("2d");
+      if (frame.keyframe !== undefined) {
+        // One byte per cell, the palette index, first row at the top
+        canvas.width = frame.width;
+        canvas.height = frame.height;
+        const cells = atob(frame.keyframe);
+        const image = context.createImageData(frame.width, frame.height);
+        for (let i = 0; i < cells.length; i++) {
+          image.data.set(this.palette[cells.charCodeAt(i)], i * 4);
+        }
+        context.putImageData(image, 0, 0);
+      }
+      // x, y, index of every changed cell
+      const cells = frame.cells || [];
+      for (let i = 0; i < cells.length; i += 3) {
+        const [r, g, b, a] = this.palette[cells[i + 2]];
+        context.fillStyle = `rgba(${r}, ${g}, ${b}, ${a / 255})`;
+        context.fillRect(cells[i], cells[i + 1], 1, 1);
+      }
+    },
+  },
+};
+</script>
+"""
+
+
+class DeltaCanvas(ipyvue.VueTemplate):
+    """
+    The <canvas> of a DeltaView.
+    Attributes:
+        palette: RGBA color (0-255) of every index.
+        frame: Last frame: width, height and keyframe (base64 of the indices)
+            for a keyframe, and cells, a flat [x, y, index, ...] list with y
+            from the top, for the changes.
+        size: Width of the canvas on the page, in pixels.
+    """
+    template = traitlets.Unicode(TEMPLATE).tag(sync=True)
+    palette = traitlets.List([]).tag(sync=True)
+    frame = traitlets.Dict({}).tag(sync=True)
+    size = traitlets.Int(600).tag(sync=True)
+
+
+def keyframe(indices):
+    """The frame that draws the whole grid, from its indices indexed as [y, x]."""
+    height, width = indices.shape
+    # y grows upwards in the models and downwards in the canvas
+    data = np.ascontiguousarray(indices[::-1], dtype=np.uint8).tobytes()
+    return {"width": width, "height": height, "keyframe": base64.b64encode(data).decode("ascii")}
+
+
+@solara.component
+def DeltaView(model, full_frame, cell_index, palette, size=600):
+    """
+    Draws the grid of a model, sending only the changed cells after the
+    first frame.
+    Args:
+        full_frame: full_frame(model) returns the palette index of every cell
+            as a (height, width) array indexed as [y, x].
+        cell_index: cell_index(model, x, y) returns the index of one cell.
+        palette: List of colors, (r, g, b, a) from 0 to 255.
+        size: Width of the canvas on the page, in pixels.
+    """
+    update_counter.get()
+    # Model drawn by this view and frames since its last keyframe
+    drawn = solara.use_ref(None)
+
+    # No step of the fast-forward runs while the frame is taken (see
+    # shared/runner.py)
+    with step_lock(model):
+        changes = model.take_changes()
+        height = model.height
+        send_keyframe = (
+            changes is None
+            or drawn.current is None
+            or drawn.current[0] is not model
+            or drawn.current[1] >= KEYFRAME_EVERY
+            or len(changes) > KEYFRAME_SHARE * model.width * height
+        )
+        if send_keyframe:
+            frame = keyframe(full_frame(model))
+            drawn.current = [model, 0]
+        else:
+            cells = []
+            for x, y in changes:
+                cells += (x, height - 1 - y, int(cell_index(model, x, y)))
+            frame = {"cells": cells}
+            drawn.current[1] += 1
+
+    DeltaCanvas.element(palette=[list(color) for color in palette], frame=frame, size=size)
@@ -0,0 +1,66 @@
+"""Checkpoint files of the models.
+
+A checkpoint is a compressed .npz file: the arrays with the state of the
+model plus a JSON header with its parameters, its step count and the
+state of its two random generators (model.random and model.rng). It is
+written and read without pickle, so a file can't run any code.
+"""
+import json
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def write(path, model, params, **arrays):
+    """Write the checkpoint of a model.
+
+    Args:
+        path: File to write; np.savez adds ".npz" if it has no extension.
+        model: The model, for its steps, running flag and generators.
+        params: JSON-serializable dict with what the model needs to be
+            rebuilt (sizes, rule, engine...).
+        arrays: Named numpy arrays with the rest of the state.
+    """
+    version, internal_state, gauss_next = model.random.getstate()
+    header = {
+        "format": FORMAT_VERSION,
+        "model": type(model).__name__,
+        "params": params,
+        "steps": model.steps,
+        "running": model.running,
+        "random_version": version,
+        "random_gauss_next": gauss_next,
+        "rng": model.rng.bit_generator.state,
+    }
+    np.savez_compressed(
+        path,
+        header=np.array(json.dumps(header)),
+        random_state=np.array(internal_state, dtype=np.uint32),
+        **arrays,
+    )
+
+
+def read(path, model_class):
+    """Read a checkpoint written by write() for a model of model_class.
+
+    Returns:
+        (header, arrays): the JSON header as a dict and the other arrays.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data["header"]))
+        arrays = {name: data[name] for name in data.files if name != "header"}
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unknown checkpoint format {header.get('format')!r} in {path}")
+    if header.get("model") != model_class.__name__:
+        raise ValueError(f"{path} is a checkpoint of {header.get('model')}, not of {model_class.__name__}")
+    return header, arrays
+
+
+def restore(model, header, arrays):
+    """Set the steps, running flag and random generators of a rebuilt model."""
+    internal_state = tuple(int(value) for value in arrays["random_state"])
+    model.random.setstate((header["random_version"], internal_state, header["random_gauss_next"]))
+    model.rng.bit_generator.state = header["rng"]
+    model.steps = header["steps"]
+    model.running = header["running"]
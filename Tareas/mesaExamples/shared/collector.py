@@ -0,0 +1,208 @@
+"""Column-based data collector for long runs of the RandomModel.
+
+Mesa's DataCollector keeps one dict per step and builds the DataFrame
+at the end. ColumnarCollector writes the values into preallocated numpy
+columns instead. Every full chunk is moved to a list of arrays, or, when
+an output folder is given, written to its own Parquet or Arrow IPC file
+(output_dir/model_vars/part-00000.parquet, ...). Only with the folder is
+the memory of a run of millions of steps kept at a single chunk; the
+list of arrays grows with the run, although much less than the dicts.
+Each part is a complete file, so the DataFrames can be read in the
+middle of a run while the collector goes on writing. Writing files
+needs pyarrow, which is only imported when it is used.
+"""
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ("parquet", "arrow")
+
+
+class ColumnarCollector:
+    """
+    Collects model and agent values every `interval` steps into numpy columns.
+    It has the methods of Mesa's DataCollector that the model, the Solara
+    plots and the batch runner use: collect(), get_model_vars_dataframe()
+    and get_agent_vars_dataframe().
+    Args:
+        model_reporters: Dict from column name to a function of the model.
+        agent_reporters: Dict from column name to an attribute name or a
+            function of the agent, collected for every agent of agent_type.
+        agent_type: Class of the agents with per-agent values (subclasses
+            included).
+        interval: Collect only on the steps that are a multiple of it.
+        chunk_size: Rows kept in memory per table before a flush.
+        output_dir: Folder for the model_vars and agent_vars parts. Without
+            it the chunks stay in memory (self.chunks of every table),
+            which grows without limit in a long run; the memory only stays
+            at one chunk per table with a folder.
+        file_format: "parquet" or "arrow" (Arrow IPC).
+    """
+    def __init__(self, model_reporters=None, agent_reporters=None, agent_type=None, interval=1,
+                 chunk_size=65_536, output_dir=None, file_format="parquet"):
+        if interval < 1:
+            raise ValueError(f"The interval must be at least 1, got {interval}")
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown file format {file_format!r}, expected one of {FORMATS}")
+        if agent_reporters and agent_type is None:
+            raise ValueError("agent_reporters need an agent_type")
+
+        self.model_reporters = dict(model_reporters or {})
+        self.agent_reporters = {
+            name: operator.attrgetter(reporter) if isinstance(reporter, str) else reporter
+            for name, reporter in (agent_reporters or {}).items()
+        }
+        self.agent_type = agent_type
+        self.interval = interval
+
+        def sink(name):
+            if output_dir is None:
+                return None
+            return _ArrowSink(os.path.join(output_dir, name), file_format)
+
+        model_columns = {"Step": np.int64}
+        model_columns.update((name, np.float64) for name in self.model_reporters)
+        self.model_vars = _Table(model_columns, chunk_size, sink("model_vars"))
+
+        agent_columns = {"Step": np.int64, "AgentID": np.int64}
+        agent_columns.update((name, np.float64) for name in self.agent_reporters)
+        self.agent_vars = _Table(agent_columns, chunk_size, sink("agent_vars") if self.agent_reporters else None)
+
+    def collect(self, model):
+        """Add the values of the model (and its agents) if this step is collected."""
+        step = model.steps
+        if step % self.interval:
+            return
+
+        row = {"Step": [step]}
+        for name, reporter in self.model_reporters.items():
+            row[name] = [reporter(model)]
+        self.model_vars.append(row)
+
+        if self.agent_reporters:
+            agents = [
+                agent
+                for agent_class, agent_set in model.agents_by_type.items()
+                if issubclass(agent_class, self.agent_type)
+                for agent in agent_set
+            ]
+            columns = {
+                "Step": np.full(len(agents), step),
+                "AgentID": [agent.unique_id for agent in agents],
+            }
+            for name, reporter in self.agent_reporters.items():
+                columns[name] = [reporter(agent) for agent in agents]
+            self.agent_vars.append(columns)
+
+    def get_model_vars_dataframe(self):
+        """DataFrame of the model values, indexed by step."""
+        return self.model_vars.frame().set_index("Step")
+
+    def get_agent_vars_dataframe(self):
+        """DataFrame of the agent values, indexed by (Step, AgentID) like Mesa's."""
+        return self.agent_vars.frame().set_index(["Step", "AgentID"])
+
+    def close(self):
+        """Write the last rows. Nothing can be collected after it."""
+        self.model_vars.close()
+        self.agent_vars.close()
+
+
+class _Table:
+    """Columns of a table, filled in preallocated chunks of chunk_size rows."""
+    def __init__(self, columns, chunk_size, sink=None):
+        self.chunk_size = chunk_size
+        self.sink = sink
+        self.chunks = []
+        self.closed = False
+        self._buffers = {name: np.empty(chunk_size, dtype=dtype) for name, dtype in columns.items()}
+        self._length = 0
+
+    def append(self, columns):
+        """Append rows given as a dict from column name to same-length values."""
+        if self.closed:
+            raise RuntimeError("The collector is closed")
+        columns = {name: np.asarray(values) for name, values in columns.items()}
+        rows = len(columns["Step"])
+        start = 0
+        while start < rows:
+            count = min(rows - start, self.chunk_size - self._length)
+            end = self._length + count
+            for name, buffer in self._buffers.items():
+                buffer[self._length:end] = columns[name][start:start + count]
+            self._length = end
+            start += count
+            if self._length == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Move the filled rows to self.chunks or to the file."""
+        if not self._length:
+            return
+        chunk = {name: buffer[:self._length].copy() for name, buffer in self._buffers.items()}
+        self._length = 0
+        if self.sink is None:
+            self.chunks.append(chunk)
+        else:
+            self.sink.write(chunk)
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        if self.sink is not None and not self.sink.parts:
+            # Write the columns even without rows, so the folder can be read
+            self.sink.write({name: buffer[:0] for name, buffer in self._buffers.items()})
+        self.closed = True
+
+    def frame(self):
+        """All the rows as a DataFrame, the flushed ones plus the ones still in the buffers."""
+        chunks = self.chunks if self.sink is None else self.sink.read()
+        chunks = chunks + [{name: buffer[:self._length] for name, buffer in self._buffers.items()}]
+        return pd.DataFrame({name: np.concatenate([chunk[name] for chunk in chunks]) for name in self._buffers})
+
+
+class _ArrowSink:
+    """Folder where every chunk of a table is written as a Parquet or Arrow IPC file."""
+    def __init__(self, path, file_format):
+        # Fail when the collector is made, not at the first flush of a long run
+        try:
+            import pyarrow
+        except ImportError as error:
+            raise ImportError("pyarrow is needed to write Parquet or Arrow files") from error
+        self._pa = pyarrow
+        self.path = path
+        self.file_format = file_format
+        self.parts = []
+        os.makedirs(path, exist_ok=True)
+        # The parts of an earlier run would be read with the new ones
+        for name in os.listdir(path):
+            if name.startswith("part-") and name.endswith(f".{file_format}"):
+                os.remove(os.path.join(path, name))
+
+    def write(self, chunk):
+        pa = self._pa
+        table = pa.table(chunk)
+        part = os.path.join(self.path, f"part-{len(self.parts):05d}.{self.file_format}")
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            pq.write_table(table, part)
+        else:
+            with pa.ipc.new_file(part, table.schema) as writer:
+                writer.write_table(table)
+        self.parts.append(part)
+
+    def read(self):
+        """Return the chunks written so far as dicts of numpy arrays."""
+        pa = self._pa
+        chunks = []
+        for part in self.parts:
+            if self.file_format == "parquet":
+                import pyarrow.parquet as pq
+                table = pq.read_table(part)
+            else:
+                table = pa.ipc.open_file(part).read_all()
+            chunks.append({name: table.column(name).to_numpy() for name in table.column_names})
+        return chunks
@@ -0,0 +1,238 @@
+from collections import OrderedDict
+
+# A jump may compute at most one new node result per this many generations.
+# A result costs about as much as 3 to 10 generations of a packed row, so a
+# jump over that budget isn't finding the repeated blocks HashLife relies
+# on, and it is stepped generation by generation instead.
+GENERATIONS_PER_RESULT = 16
+
+
+def next_row_bits(bits, width, rule_table):
+    """Compute the next generation of a row packed in an int.
+
+    Bit x of `bits` is the state of cell x. Shifting the whole row one bit
+    gives the left/right neighbor of every cell at once (wrapping around like
+    the torus), so the rule is evaluated with a few bitwise operations per
+    row instead of one lookup per cell.
+    """
+    mask = (1 << width) - 1
+    center = bits
+    left = ((bits << 1) & mask) | (bits >> (width - 1))  # bit x = cell x-1
+    right = (bits >> 1) | ((bits & 1) << (width - 1))   # bit x = cell x+1
+
+    # Rule 90: alive when exactly one of the left and right neighbors is alive
+    if rule_table == RULE_90:
+        return left ^ right
+
+    # Any other rule: OR of the alive patterns, each one an AND of the 3 rows
+    result = 0
+    for pattern, alive in enumerate(rule_table):
+        if not alive:
+            continue
+        term = left if pattern & 4 else left ^ mask
+        term &= center if pattern & 2 else center ^ mask
+        term &= right if pattern & 1 else right ^ mask
+        result |= term
+    return result
+
+
+RULE_90 = tuple((90 >> pattern) & 1 for pattern in range(8))
+
+
+class _OverBudget(Exception):
+    """A jump needed more new node results than its budget."""
+
+
+class Node:
+    """Block of 2**level cells of a row.
+
+    Nodes are canonical: two blocks with the same cells are the same Node
+    object, so a node can be used as the key of the result cache.
+    """
+
+    __slots__ = ("level", "left", "right", "state")
+
+    def __init__(self, level, left=None, right=None, state=0):
+        self.level = level
+        self.left = left
+        self.right = right
+        self.state = state
+
+
+class HashLife:
+    """HashLife engine for elementary cellular automata on a ring.
+
+    A row is split into a binary tree of canonical nodes. The result of a
+    node of level n is its center half after 2**(n-2) generations, which
+    only depends on the node itself, so it is computed once and looked up
+    every other time the same block appears, at any position or generation.
+    Regular rules such as rule 90 on rings whose width is a power of two
+    repeat a lot of blocks, and jumping billions of generations only costs
+    a few thousand node results.
+
+    Other rings don't repeat: every generation brings new blocks, so the
+    tree would cost more than stepping. Every jump has a budget of
+    generations / GENERATIONS_PER_RESULT new results; a jump that goes over
+    it is stepped with next_row_bits() instead, so the engine is never much
+    slower than the packed engine.
+
+    The node table and the result cache are LRU caches of node_limit
+    entries each: the least recently used one is dropped to make room. A
+    node dropped from the table is made again as a new node the next time
+    its block appears, which only costs the results cached for the old one.
+
+    Args:
+        rule_table: 8-entry table of the rule, see compile_rule().
+        node_limit: Maximum number of canonical nodes and of cached results.
+    Attributes:
+        jumps: Jumps done with the tree.
+        stepped: Jumps stepped because they went over their budget.
+    """
+
+    def __init__(self, rule_table, node_limit=1_000_000):
+        self.rule_table = tuple(rule_table)
+        self.node_limit = node_limit
+        self.jumps = 0
+        self.stepped = 0
+        self._leaves = (Node(0, state=0), Node(0, state=1))
+        self._nodes = OrderedDict()
+        self._results = OrderedDict()
+        self._budget = 0
+
+    def join(self, left, right):
+        """Return the canonical node made of two nodes of the same level."""
+        key = (left, right)
+        nodes = self._nodes
+        node = nodes.get(key)
+        if node is None:
+            node = Node(left.level + 1, left, right)
+            nodes[key] = node
+            if len(nodes) > self.node_limit:
+                nodes.popitem(last=False)
+        else:
+            nodes.move_to_end(key)
+        return node
+
+    def result(self, node):
+        """Return the center half of a node (level >= 2) after 2**(level-2) generations."""
+        cached = self._results.get(node)
+        if cached is not None:
+            self._results.move_to_end(node)
+            return cached
+        self._budget -= 1
+        if self._budget < 0:
+            raise _OverBudget
+
+        if node.level == 2:
+            # 4 cells a b c d -> the new states of b and c after one generation
+            a = node.left.left.state
+            b = node.left.right.state
+            c = node.right.left.state
+            d = node.right.right.state
+            table = self.rule_table
+            result = self.join(
+                self._leaves[table[(a << 2) | (b << 1) | c]],
+                self._leaves[table[(b << 2) | (c << 1) | d]],
+            )
+        else:
+            # Quarters a b c d: advance the overlapping halves ab, bc and cd
+            # half of the time, then the two overlapping results the other half
+            a, b = node.left.left, node.left.right
+            c, d = node.right.left, node.right.right
+            r1 = self.result(self.join(a, b))
+            r2 = self.result(self.join(b, c))
+            r3 = self.result(self.join(c, d))
+            result = self.join(
+                self.result(self.join(r1, r2)),
+                self.result(self.join(r2, r3)),
+            )
+
+        self._results[node] = result
+        if len(self._results) > self.node_limit:
+            self._results.popitem(last=False)
+        return result
+
+    def advance(self, row, generations):
+        """Return the states of a ring of cells after some generations.
+
+        Args:
+            row: Sequence of 0/1 states; the last cell is next to the first.
+            generations: Number of generations to advance, any size.
+        Returns:
+            List with the new states.
+        """
+        if generations < 0:
+            raise ValueError(f"Can't advance a negative number of generations, got {generations}")
+        row = list(row)
+        # One jump per bit of the number of generations
+        jump = 0
+        while generations:
+            if generations & 1:
+                row = self._jump(row, jump)
+            generations >>= 1
+            jump += 1
+        return row
+
+    def _jump(self, row, k):
+        """Advance a ring 2**k generations, with the tree or by stepping."""
+        generations = 1 << k
+        if generations < GENERATIONS_PER_RESULT:
+            return self._step(row, generations)
+
+        self._budget = generations // GENERATIONS_PER_RESULT
+        try:
+            new_row = self._tree_jump(row, k)
+        except _OverBudget:
+            # The results computed so far stay valid for later jumps
+            self.stepped += 1
+            return self._step(row, generations)
+        self.jumps += 1
+        return new_row
+
+    def _step(self, row, generations):
+        """Advance a ring generation by generation, packed in an int."""
+        width = len(row)
+        bits = sum(state << x for x, state in enumerate(row))
+        rule_table = self.rule_table
+        for _ in range(generations):
+            bits = next_row_bits(bits, width, rule_table)
+        return [(bits >> x) & 1 for x in range(width)]
+
+    def _tree_jump(self, row, k):
+        """Advance a ring 2**k generations with the results of the tree."""
+        width = len(row)
+        generations = 1 << k
+        level = k + 2
+        # Blocks of the ring repeated forever, keyed by (level, first cell)
+        blocks = {}
+
+        def block(level, offset):
+            key = (level, offset)
+            node = blocks.get(key)
+            if node is None:
+                if level == 0:
+                    node = self._leaves[row[offset]]
+                else:
+                    half = 1 << (level - 1)
+                    node = self.join(block(level - 1, offset), block(level - 1, (offset + half) % width))
+                blocks[key] = node
+            return node
+
+        # Every node gives the new states of its center 2 * generations
+        # cells, so the ring is covered by tiles of that size
+        tile = 2 * generations
+        new_row = []
+        for start in range(0, width, tile):
+            node = block(level, (start - generations) % width)
+            self._read(self.result(node), min(tile, width - start), new_row)
+        return new_row
+
+    def _read(self, node, count, out):
+        """Append the states of the first `count` cells of a node to out."""
+        if node.level == 0:
+            out.append(node.state)
+            return
+        half = 1 << (node.level - 1)
+        self._read(node.left, min(count, half), out)
+        if count > half:
+            self._read(node.right, count - half, out)
@@ -0,0 +1,194 @@
+"""Stepping of a large board in several processes, by horizontal tiles.
+
+The board lives in a multiprocessing.shared_memory block, which the model
+uses as its states array. Every worker process owns a band of rows (a
+tile). In every generation it reads its rows plus the row above and the
+row below (the halos, owned by the tiles next to it; the board is a
+torus) and computes the new tile into its own array. It then waits at a
+barrier until every worker has read the board, writes the tile back and
+waits again before the next generation. The rule of the elementary
+automaton only looks at the row of each cell, so its tiles have no
+halos and run their generations without waiting for each other.
+
+The model process only joins the barriers of a batch of generations
+(advance(n)), so n generations don't go through the model at all. It
+waits at most `timeout` seconds per generation: if a worker died (killed
+by the system when out of memory, for example) or got stuck, advance()
+stops the workers and raises instead of waiting forever. The workers are
+started with "spawn", which is safe in a process with threads, like the
+Solara server.
+"""
+import multiprocessing
+import os
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def life_tile(rows, table, out):
+    """Next states of rows[1:-1] with the life table (state * 9 + neighbors).
+
+    rows has the row above and below the tile; the columns wrap around.
+    """
+    column = rows[:-2] + rows[1:-1] + rows[2:]
+    block = np.roll(column, 1, axis=1) + column + np.roll(column, -1, axis=1)
+    # The block includes the cell itself, so state * 9 + neighbors is state * 8 + block
+    np.take(table, (rows[1:-1] << 3) + block, out=out)
+
+
+def rule_tile(rows, table, out):
+    """Next states of every row of rows with an elementary rule table."""
+    left = np.roll(rows, 1, axis=1)
+    right = np.roll(rows, -1, axis=1)
+    np.take(table, (left << 2) | (rows << 1) | right, out=out)
+
+
+def _work(name, shape, kind, table, start, stop, barrier, batch):
+    """Loop of a worker: step the rows start:stop for every batch until a batch of 0."""
+    memory = shared_memory.SharedMemory(name=name)
+    board = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+    table = np.array(table, dtype=np.uint8)
+    tile = np.empty((stop - start, shape[1]), dtype=np.uint8)
+    # The tile and its halos, wrapping around the torus
+    rows = np.arange(start - 1, stop + 1) % shape[0]
+    try:
+        while True:
+            barrier.wait()
+            generations = batch.value
+            if not generations:
+                break
+            for _ in range(generations):
+                if kind == "life":
+                    life_tile(board[rows], table, tile)
+                    # Nobody writes before every worker read its halos
+                    barrier.wait()
+                    board[start:stop] = tile
+                    barrier.wait()
+                else:
+                    rule_tile(board[start:stop], table, tile)
+                    board[start:stop] = tile
+            barrier.wait()
+    finally:
+        del board
+        memory.close()
+
+
+class TiledStepper:
+    """
+    Workers that step a board held in shared memory.
+    Attributes:
+        board: The board, a (height, width) uint8 array in the shared
+            memory. Changes made to it are seen by the next generation.
+        workers: Number of worker processes (at most one per row).
+        timeout: Seconds a generation may take before the workers are
+            taken as stuck.
+    """
+    def __init__(self, shape, kind, table, workers=None, timeout=60):
+        """
+        Args:
+            shape: (height, width) of the board, which starts with every
+                cell dead. The initial states are written to self.board
+                before the first advance().
+            kind: "life" for the life rule, "rows" for an elementary rule
+                applied to every row.
+            table: The life table indexed by state * 9 + neighbors, or the
+                rule table indexed by the (left, center, right) pattern.
+            workers: Number of processes, os.cpu_count() by default.
+        """
+        if kind not in ("life", "rows"):
+            raise ValueError(f"Unknown kind {kind!r}, expected 'life' or 'rows'")
+        height, width = shape
+        self.timeout = timeout
+        self.workers = max(1, min(workers or os.cpu_count() or 1, height))
+
+        memory = shared_memory.SharedMemory(create=True, size=max(1, height * width))
+        self.board = np.ndarray((height, width), dtype=np.uint8, buffer=memory.buf)
+        self.board[...] = 0
+
+        context = multiprocessing.get_context("spawn")
+        # The model process takes part in every barrier too
+        self._barrier = context.Barrier(self.workers + 1)
+        self._batch = context.RawValue("q", 0)
+        self._halos = kind == "life"
+        bounds = np.linspace(0, height, self.workers + 1).astype(int)
+        processes = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            process = context.Process(
+                target=_work,
+                args=(memory.name, (height, width), kind, list(table), int(start), int(stop),
+                      self._barrier, self._batch),
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+        self._processes = processes
+        self._finalizer = weakref.finalize(self, _shutdown, memory, processes, self._barrier, self._batch)
+
+    def advance(self, generations):
+        """Run a number of generations in the workers and wait for them."""
+        if generations <= 0:
+            return
+        if not self._finalizer.alive:
+            raise RuntimeError("The stepper is closed")
+        self._check_workers()
+        self._batch.value = generations
+        self._wait(self.timeout)
+        if self._halos:
+            for _ in range(2 * generations):
+                self._wait(self.timeout)
+            self._wait(self.timeout)
+        else:
+            # The rows run all their generations between two barriers
+            self._wait(self.timeout * generations)
+
+    def _check_workers(self):
+        """Stop the workers and raise if one of them is dead."""
+        for process in self._processes:
+            if not process.is_alive():
+                self.close()
+                raise RuntimeError(f"A worker of the stepper died (exit code {process.exitcode})")
+
+    def _wait(self, timeout):
+        """Join a barrier of the workers, raising if they don't all get there in time."""
+        try:
+            self._barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            self._check_workers()
+            self.close()
+            raise RuntimeError(f"The workers of the stepper didn't reach the barrier in {timeout} s") from None
+
+    def close(self):
+        """Stop the workers and free the shared memory (also done when collected).
+
+        The worker processes have ended when it returns.
+        """
+        self._finalizer()
+
+
+def _shutdown(memory, processes, barrier, batch):
+    """Send the batch of 0 generations that stops the workers and free the memory."""
+    batch.value = 0
+    # At the exit of a child process multiprocessing has already killed the
+    # workers, and waiting for them would never end
+    if all(process.is_alive() for process in processes):
+        try:
+            barrier.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    try:
+        memory.close()
+    except BufferError:
+        # An array of the board is still in use, it keeps the mapping
+        # until it is collected
+        pass
+    memory.unlink()
@@ -0,0 +1,99 @@
+"""Timing of the phases of a model step.
+
+Every model has a Profiler in model.profiler and wraps the phases of its
+step in `with self.profiler.phase(name):`. When the profiler is enabled
+(profile=True, or model.profiler.enabled = True at any time) it adds the
+wall time and the number of calls of every phase. When it is disabled
+phase() returns an empty context manager, so a timing point only costs a
+method call.
+
+Phases can be inside other phases (in the Roomba models the "move" of
+every robot is inside the "robots" phase of the step), so their times
+don't add up; the share of each phase is relative to the "step" phase.
+"""
+import time
+
+
+class Profiler:
+    """
+    Wall time and number of calls of each phase.
+    Attributes:
+        enabled: Whether phase() records anything.
+        times: Dict from phase name to its total seconds.
+        calls: Dict from phase name to its number of calls.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.times = {}
+        self.calls = {}
+
+    def phase(self, name):
+        """Context manager that adds the time of its block to the phase `name`."""
+        if not self.enabled:
+            return _OFF
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reset(self):
+        """Forget every phase, to measure from now on."""
+        self.times.clear()
+        self.calls.clear()
+
+    def results(self):
+        """
+        Returns a list with a dict per phase, slowest first, with its name,
+        calls, total seconds, mean microseconds per call and share of the
+        "step" phase (None without it).
+        """
+        step = self.times.get("step")
+        return [
+            {
+                "phase": name,
+                "calls": self.calls[name],
+                "total_s": seconds,
+                "mean_us": seconds / self.calls[name] * 1e6,
+                "share": seconds / step if step else None,
+            }
+            for name, seconds in sorted(self.times.items(), key=lambda item: -item[1])
+        ]
+
+    def table(self):
+        """The results as a Markdown table, for printing or for the Solara panel."""
+        lines = ["| Phase | Calls | Total (s) | Mean (µs) | Share |", "|---|---:|---:|---:|---:|"]
+        for row in self.results():
+            share = "" if row["share"] is None else f"{row['share']:.1%}"
+            lines.append(f"| {row['phase']} | {row['calls']} | {row['total_s']:.4f} | "
+                         f"{row['mean_us']:.1f} | {share} |")
+        return "\n".join(lines)
+
+
+class _Phase:
+    """Times one block of an enabled profiler."""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class _Off:
+    """Phase of a disabled profiler: does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_OFF = _Off()
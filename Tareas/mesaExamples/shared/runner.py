@@ -0,0 +1,124 @@
+"""Fast-forward of a model in a background thread, for the Solara pages.
+
+The play button of SolaraViz steps the model and redraws every component
+after each step (or every render_interval steps), so the speed of the
+run is the speed of the drawing. FastForward steps the model in its own
+thread instead, at full speed, and redraws the page at most `fps` times
+a second with the state of that moment. The drawing happens in the same
+thread between two steps, so the components never see a half-done step.
+
+The play and step buttons of SolaraViz keep working during the run, so
+every step of the model holds a lock (see step_lock()) and the same
+model is never stepped by two threads at once. FastForward also holds it
+while it redraws the page (force_update() draws in the calling thread),
+and DeltaView takes it while it reads the model, so those views see
+whole steps even when the play button draws them in the middle of a
+frame of the fast-forward. Other components drawn by the play button,
+like Mesa's plots, don't take the lock.
+"""
+import threading
+import time
+
+import solara
+from mesa.visualization.utils import force_update
+
+
+def advance(model, steps, deadline):
+    """
+    Steps the model until it stops running and, with steps > 0, at most
+    that many times; with steps == 0 until time.perf_counter() passes the
+    deadline. Returns the number of steps done.
+    """
+    done = 0
+    while model.running:
+        if steps and done == steps:
+            break
+        if not steps and time.perf_counter() >= deadline:
+            break
+        model.step()
+        done += 1
+    return done
+
+
+def close_replaced(model):
+    """
+    Subscribes to a solara.reactive holding the model of a page, so the
+    model replaced by the reset button or by a new parameter is closed
+    (the workers of the parallel engine stop with it). Returns the
+    function that unsubscribes, as solara.use_effect expects.
+    """
+    def on_change(new, old):
+        if old is not new and hasattr(old, "close"):
+            old.close()
+
+    return model.subscribe_change(on_change)
+
+
+def step_lock(model):
+    """
+    Returns the lock held by every step of the model. The first call wraps
+    model.step (which is already the wrapper of Mesa that counts the steps)
+    in place, so the steps of the SolaraViz buttons take it too.
+    """
+    lock = model.__dict__.get("_step_lock")
+    if lock is None:
+        lock = threading.RLock()
+        step = model.step
+
+        def locked_step(*args, **kwargs):
+            with lock:
+                step(*args, **kwargs)
+
+        model._step_lock = lock
+        model.step = locked_step
+    return lock
+
+
+@solara.component
+def FastForward(model):
+    """
+    Start/stop button and sliders of the background run. "Steps per
+    frame" 0 runs as many steps as fit between two frames; any other value
+    runs exactly that many and then waits for the next frame.
+    """
+    playing = solara.use_reactive(False)
+    fps = solara.use_reactive(5)
+    steps_per_frame = solara.use_reactive(0)
+    speed = solara.use_reactive("")
+    lock = step_lock(model)
+
+    def run(cancel):
+        if not playing.value:
+            return
+        start = time.perf_counter()
+        total = 0
+        while not cancel.is_set() and model.running:
+            frame_start = time.perf_counter()
+            deadline = frame_start + 1 / fps.value
+            # The play button waits until the steps of this frame are done
+            # and drawn
+            with lock:
+                total += advance(model, steps_per_frame.value, deadline)
+                speed.value = f"{total / (time.perf_counter() - start):,.0f} steps/s"
+                force_update()
+            # With a fixed number of steps, don't draw faster than fps
+            rest = deadline - time.perf_counter()
+            if rest > 0:
+                cancel.wait(rest)
+        if not model.running:
+            playing.value = False
+
+    # Without intrusive_cancel, solara would trace every line of the thread
+    solara.use_thread(run, dependencies=[playing.value, model], intrusive_cancel=False)
+
+    with solara.Column():
+        solara.Button(
+            label="Stop" if playing.value else "Fast forward",
+            color="primary",
+            on_click=lambda: playing.set(not playing.value),
+            disabled=not model.running,
+        )
+        solara.SliderInt("Frames per second", value=fps, min=1, max=30)
+        solara.SliderInt("Steps per frame (0 = as many as fit)", value=steps_per_frame, min=0, max=1000)
+        if speed.value:
+            solara.Text(speed.value)